@@ -0,0 +1,529 @@
+import os
+import re
+import io
+import sys
+import json
+import time
+import hashlib
+import zipfile
+import argparse
+import threading
+import contextlib
+import statistics
+import subprocess
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def isolated_env(home):
+    """Environment with a throwaway user data dir so results don't depend on local config or cache"""
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['LOCALAPPDATA'] = home
+    env['APPDATA'] = home
+    env['TERM'] = 'dumb'
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    return env
+
+def time_import(env):
+    """Seconds spent importing main.py in a fresh interpreter"""
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def time_to_first_prompt(env, timeout=30):
+    """Seconds from process start until the interactive URL prompt is shown"""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-u', 'main.py'], cwd=REPO_DIR, env=env,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    output = b''
+    try:
+        while b'URL:' not in output:
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError("Timed out waiting for the URL prompt")
+            chunk = os.read(proc.stdout.fileno(), 4096)
+            if not chunk:
+                raise RuntimeError("main.py exited before showing the URL prompt")
+            output += chunk
+        elapsed = time.perf_counter() - start
+        proc.stdin.write(b'quit\n')
+        proc.stdin.flush()
+    finally:
+        proc.stdin.close()
+        proc.stdout.close()
+        proc.wait(timeout=timeout)
+    return elapsed
+
+def report(name, samples, limit_ms=None):
+    """Print summary statistics and return False if the median exceeds limit_ms"""
+    median_ms = statistics.median(samples) * 1000
+    print(f"   {name:<22} median {median_ms:8.1f} ms   min {min(samples) * 1000:8.1f} ms   "
+          f"max {max(samples) * 1000:8.1f} ms")
+    if limit_ms is not None and median_ms > limit_ms:
+        print(f"❌ {name} regressed: {median_ms:.1f} ms > {limit_ms:.1f} ms")
+        return False
+    return True
+
+def run_startup(args):
+    print(f"⏱️  Startup benchmark ({args.runs} runs, Python {sys.version.split()[0]})")
+    with tempfile.TemporaryDirectory() as home:
+        env = isolated_env(home)
+        # One untimed run so bytecode compilation and disk cache don't skew the first sample
+        time_import(env)
+        import_samples = [time_import(env) for _ in range(args.runs)]
+        prompt_samples = [time_to_first_prompt(env) for _ in range(args.runs)]
+    ok = report("import main", import_samples, args.max_import_ms)
+    ok = report("time to first prompt", prompt_samples, args.max_prompt_ms) and ok
+    return 0 if ok else 1
+
+def fake_info(index):
+    """An info dict shaped like yt-dlp's output for a YouTube video.
+
+    Strings are built per video, as they are when yt-dlp parses a real response, so no
+    memory is shared between entries.
+    """
+    video_id = f"{index:011d}"
+    expire = 1700000000 + index
+    def stream_url(itag):
+        return (f"https://rr{index % 9}---sn-abc{index % 97}.googlevideo.com/videoplayback?expire={expire}"
+                f"&ei=x{index}&ip=203.0.113.{index % 250}&id=o-{video_id}&itag={itag}&source=youtube"
+                + "&sig=" + "A" * 600 + f"{index}")
+    headers = {'User-Agent': f'Mozilla/5.0 (X11; Linux x86_64) {index}', 'Accept': 'text/html',
+               'Accept-Language': 'en-us,en;q=0.5', 'Sec-Fetch-Mode': 'navigate'}
+    formats = []
+    for itag, height in ((160, 144), (133, 240), (134, 360), (135, 480), (136, 720), (137, 1080),
+                         (298, 720), (299, 1080), (278, 144), (242, 240), (243, 360), (244, 480),
+                         (247, 720), (248, 1080), (271, 1440), (313, 2160)):
+        formats.append({'format_id': str(itag), 'url': stream_url(itag), 'ext': 'mp4', 'height': height,
+                        'width': height * 16 // 9, 'fps': 30, 'vcodec': 'avc1.4d401f', 'acodec': 'none',
+                        'filesize': height * 100000 + index, 'tbr': height * 2.5, 'protocol': 'https',
+                        'format_note': f'{height}p', 'http_headers': dict(headers),
+                        'downloader_options': {'http_chunk_size': 10485760}})
+    for itag, abr in ((139, 48), (249, 50), (250, 70), (140, 129), (251, 135)):
+        formats.append({'format_id': str(itag), 'url': stream_url(itag), 'ext': 'm4a' if itag < 200 else 'webm',
+                        'abr': abr, 'acodec': 'mp4a.40.2' if itag < 200 else 'opus', 'vcodec': 'none',
+                        'filesize': abr * 10000 + index, 'protocol': 'https', 'http_headers': dict(headers)})
+    captions = {f'{lang}{index % 7}': [{'ext': ext, 'url': f"https://www.youtube.com/api/timedtext?v={video_id}"
+                                        f"&lang={lang}&fmt={ext}&" + "x" * 300, 'name': f'{lang} (auto)'}
+                                       for ext in ('json3', 'srv1', 'srv2', 'srv3', 'ttml', 'vtt')]
+                for lang in (f'l{n}' for n in range(150))}
+    return {
+        'id': video_id, 'title': f'Video number {index}', 'uploader': f'Channel {index % 100}',
+        'duration': 600 + index % 600, 'view_count': index * 31, 'upload_date': '20240101',
+        'webpage_url': f'https://www.youtube.com/watch?v={video_id}', 'extractor': 'youtube',
+        'extractor_key': 'Youtube', 'description': f'Description {index} ' + 'lorem ipsum ' * 200,
+        'tags': [f'tag{index}-{n}' for n in range(20)],
+        'thumbnails': [{'url': f'https://i.ytimg.com/vi/{video_id}/{n}.jpg', 'preference': n, 'id': str(n)}
+                       for n in range(40)],
+        'heatmap': [{'start_time': n * 6.0, 'end_time': n * 6.0 + 6, 'value': n / 100} for n in range(100)],
+        'automatic_captions': captions,
+        'formats': formats,
+    }
+
+def peak_rss_bytes():
+    """Peak RSS of this process. Linux's ru_maxrss keeps the parent's peak across exec, so
+    VmHWM is used where /proc has it"""
+    try:
+        with open('/proc/self/status', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def measure_records(mode, count):
+    """Child process body: resolve count videos, keep them as the batch queue would, print peak RSS"""
+    import main
+    baseline = peak_rss_bytes()
+    started = time.perf_counter()
+    kept = []
+    for index in range(count):
+        info = fake_info(index)
+        selected = main.get_best_video_format(info, '1080p')
+        if mode == 'raw':
+            kept.append((info, selected))
+        else:
+            kept.append(main.compact_video_record(info, selected))
+        del info, selected
+    elapsed = time.perf_counter() - started
+    peak = peak_rss_bytes()
+    print(json.dumps({'peak_bytes': peak, 'growth_bytes': peak - baseline, 'seconds': elapsed}))
+
+def run_memory(args):
+    if sys.platform == 'win32':
+        print("❌ The memory benchmark needs the resource module (Linux or macOS)")
+        return 2
+    print(f"🧠 Memory benchmark ({args.entries} resolved videos kept in memory)")
+    results = {}
+    with tempfile.TemporaryDirectory() as home:
+        env = isolated_env(home)
+        for mode in ('raw', 'compact'):
+            code = f"import benchmark; benchmark.measure_records({mode!r}, {args.entries})"
+            result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, env=env,
+                                    capture_output=True, text=True, check=True)
+            results[mode] = json.loads(result.stdout.strip().splitlines()[-1])
+    for mode, label in (('raw', 'full info dicts'), ('compact', 'VideoRecord')):
+        r = results[mode]
+        print(f"   {label:<22} peak RSS {r['peak_bytes'] / 2**20:8.1f} MB   "
+              f"growth {r['growth_bytes'] / 2**20:8.1f} MB   "
+              f"{r['growth_bytes'] / args.entries / 1024:6.1f} KB/video   {r['seconds']:5.1f} s")
+    compact_mb = results['compact']['peak_bytes'] / 2**20
+    if args.max_peak_mb is not None and compact_mb > args.max_peak_mb:
+        print(f"❌ Peak RSS regressed: {compact_mb:.1f} MB > {args.max_peak_mb:.1f} MB")
+        return 1
+    return 0
+
+# --- Offline end-to-end benchmark ---
+# A local HTTP server stands in for YouTube's stream servers and the FFmpeg download
+# site: it serves synthetic video and audio streams, either progressive (with Range
+# support, like googlevideo.com) or as DASH segments listed in an MPD, and a zip holding
+# a fake FFmpeg that muxes by copying its inputs. The DASH run has auto-tuning on, so the
+# fragment downloader and the concurrency tuner are exercised too.
+# Each scenario runs in a fresh process and user data dir whose metadata cache is
+# filled with recorded info dicts pointing at that server, so nothing is extracted live.
+# Any request that would leave the machine goes to a dead proxy and fails.
+E2E_SCENARIOS = ('single', 'batch', 'playlist', 'dash', 'bootstrap')
+E2E_PLAYLIST_URL = 'https://www.youtube.com/playlist?list=PLbenchmark'
+E2E_FFMPEG_ZIP = 'ffmpeg-benchmark.zip'
+MEDIA_BLOCK_SIZE = 1024 * 1024
+DASH_SEGMENT_BYTES = 2 * 1024 * 1024
+
+FAKE_FFMPEG = """#!{python}
+import sys
+args = sys.argv[1:]
+if '-version' in args:
+    print('ffmpeg version 0.0-benchmark')
+elif '-encoders' in args:
+    print('Encoders:\\n ------\\n A....D aac                  AAC (Advanced Audio Coding)')
+elif '-muxers' in args:
+    print('File formats:\\n --\\n  E mp4             MP4 (MPEG-4 Part 14)')
+else:
+    # Merge: write every input to the output, so muxing costs the same disk I/O as a stream copy
+    inputs = [args[i + 1] for i, arg in enumerate(args) if arg == '-i']
+    with open(args[-1], 'wb') as out:
+        for path in inputs:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    out.write(chunk)
+"""
+
+def offline_env(home):
+    """isolated_env that also routes anything not aimed at the local server to a dead proxy"""
+    env = isolated_env(home)
+    for key in ('http_proxy', 'https_proxy', 'HTTP_PROXY', 'HTTPS_PROXY', 'all_proxy', 'ALL_PROXY'):
+        env[key] = 'http://127.0.0.1:9'
+    env['no_proxy'] = env['NO_PROXY'] = '127.0.0.1,localhost'
+    return env
+
+def build_ffmpeg_zip(script, padding_bytes):
+    """A zip laid out like the real builds, padded with incompressible data to a realistic size"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr('ffmpeg-benchmark/bin/ffmpeg.exe', script)
+        zf.writestr('ffmpeg-benchmark/bin/ffprobe.exe', os.urandom(padding_bytes))
+    return buffer.getvalue()
+
+def parse_range(header, total):
+    """(start, end) of a 'bytes=a-b' Range header, or None to send the whole body"""
+    match = re.match(r'bytes=(\d*)-(\d*)$', header or '')
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if not match.group(1):
+        return max(0, total - int(match.group(2))), total - 1
+    end = int(match.group(2)) if match.group(2) else total - 1
+    return int(match.group(1)), min(end, total - 1)
+
+@contextlib.contextmanager
+def media_server(ffmpeg_zip):
+    """Serve /media/<size>/<name> streams and the FFmpeg zip; yields the base URL"""
+    import http.server
+    block = os.urandom(MEDIA_BLOCK_SIZE)
+    checksum = f"{hashlib.sha256(ffmpeg_zip).hexdigest()}  {E2E_FFMPEG_ZIP}\n".encode('utf-8')
+
+    class MediaHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_HEAD(self):
+            self.respond(send_body=False)
+
+        def do_GET(self):
+            self.respond()
+
+        def respond(self, send_body=True):
+            parts = self.path.split('?')[0].strip('/').split('/')
+            body = None
+            if len(parts) == 3 and parts[0] == 'media' and parts[1].isdigit():
+                total = int(parts[1])
+            elif len(parts) == 5 and parts[0] == 'dash' and parts[4] == 'manifest.mpd':
+                # /dash/<video_bytes>/<audio_bytes>/<index>/manifest.mpd
+                video_bytes, audio_bytes, index = (int(part) for part in parts[1:4])
+                base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+                body = render_mpd(recorded_info(index, base_url, video_bytes, audio_bytes, dash=True))
+            elif len(parts) == 4 and parts[0] == 'dash' and parts[2].isdigit():
+                # /dash/<stream>/<segment_bytes>/seg<N>.m4s
+                total = int(parts[2])
+            elif parts == ['ffmpeg', E2E_FFMPEG_ZIP]:
+                body = ffmpeg_zip
+            elif parts == ['ffmpeg', 'checksums.sha256']:
+                body = checksum
+            else:
+                self.send_error(404)
+                return
+            if body is not None:
+                total = len(body)
+            byte_range = parse_range(self.headers.get('Range'), total)
+            start, end = byte_range or (0, total - 1)
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{total}')
+            self.end_headers()
+            if not send_body:
+                return
+            try:
+                position = start
+                while position <= end:
+                    if body is not None:
+                        chunk = body[position:min(end + 1, position + MEDIA_BLOCK_SIZE)]
+                    else:
+                        offset = position % MEDIA_BLOCK_SIZE
+                        chunk = block[offset:offset + min(end + 1 - position, MEDIA_BLOCK_SIZE - offset)]
+                    self.wfile.write(chunk)
+                    position += len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def dash_fragments(base_url, stream, size, duration):
+    """Segment list for a DASH stream of size bytes, DASH_SEGMENT_BYTES per segment"""
+    count = max(1, -(-size // DASH_SEGMENT_BYTES))
+    return [{'url': f"{base_url}/dash/{stream}/{min(DASH_SEGMENT_BYTES, size - n * DASH_SEGMENT_BYTES)}/seg{n}.m4s",
+             'duration': duration / count} for n in range(count)]
+
+def render_mpd(info):
+    """A static MPD listing every format of a DASH recorded_info as a SegmentList"""
+    duration = info['duration']
+    sets = []
+    for fmt in info['formats']:
+        kind = 'audio' if fmt['vcodec'] == 'none' else 'video'
+        size = f' width="{fmt["width"]}" height="{fmt["height"]}"' if kind == 'video' else ''
+        segments = ''.join(f'<SegmentURL media="{fragment["url"]}"/>' for fragment in fmt['fragments'])
+        sets.append(f'<AdaptationSet mimeType="{kind}/mp4"><Representation id="{fmt["format_id"]}" '
+                    f'bandwidth="{fmt["filesize"] * 8 // duration}"{size}>'
+                    f'<SegmentList duration="{fmt["fragments"][0]["duration"]:.3f}">{segments}</SegmentList>'
+                    f'</Representation></AdaptationSet>')
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" '
+            f'type="static" mediaPresentationDuration="PT{duration}S" '
+            f'profiles="urn:mpeg:dash:profile:isoff-main:2011"><Period>{"".join(sets)}</Period></MPD>\n'
+            ).encode('utf-8')
+
+def recorded_info(index, base_url, video_bytes, audio_bytes, dash=False):
+    """fake_info(index) with its streams served by the local media server.
+
+    Stream sizes scale with height and bitrate so the 1080p video is video_bytes and the
+    m4a audio is audio_bytes. With dash=True every format is a segmented DASH stream, as
+    yt-dlp's DASH manifest parser would have returned it.
+    """
+    info = fake_info(index)
+    manifest_url = f"{base_url}/dash/{video_bytes}/{audio_bytes}/{index}/manifest.mpd"
+    for fmt in info['formats']:
+        if fmt['vcodec'] != 'none':
+            size = max(1, video_bytes * fmt['height'] // 1080)
+        else:
+            size = max(1, audio_bytes * fmt['abr'] // 129)
+        stream = f"{info['id']}.f{fmt['format_id']}"
+        if dash:
+            fmt.update({'filesize': size, 'protocol': 'http_dash_segments', 'url': manifest_url,
+                        'manifest_url': manifest_url,
+                        'fragments': dash_fragments(base_url, stream, size, info['duration'])})
+            fmt.pop('downloader_options', None)
+        else:
+            fmt.update({'filesize': size, 'protocol': 'http',
+                        'url': f"{base_url}/media/{size}/{stream}.{fmt['ext']}"})
+    return info
+
+def run_scenario(scenario, base_url, videos, workers, video_bytes, audio_bytes, ffmpeg_path):
+    """Child process body: run one scenario against the local server and print its results"""
+    import resource
+    import main
+    home = os.environ['HOME']
+    output_dir = os.path.join(home, 'videos')
+    results = {'scenario': scenario}
+    if scenario == 'bootstrap':
+        source = {'url': f'{base_url}/ffmpeg/{E2E_FFMPEG_ZIP}', 'checksum_url': f'{base_url}/ffmpeg/checksums.sha256'}
+        started = time.perf_counter()
+        installed = main.download_ffmpeg([source], os.path.join(home, 'ffmpeg'))
+        results['seconds'] = time.perf_counter() - started
+        results['stages'] = {'bootstrap': results['seconds']}
+        results['failed'] = 0 if installed else 1
+    else:
+        config = main.load_config()
+        config['ffmpeg_path'] = ffmpeg_path
+        main.save_config(config)
+        urls = []
+        for index in range(1 if scenario == 'single' else videos):
+            info = recorded_info(index, base_url, video_bytes, audio_bytes, dash=scenario == 'dash')
+            main.write_cached_info(info['id'], info, config.get('cache_max_entries', 5000))
+            urls.append(info['webpage_url'])
+        del info
+        extract_seconds = []
+        get_video_info = main.get_video_info
+
+        def timed_get_video_info(url, use_cache=True):
+            started = time.perf_counter()
+            try:
+                return get_video_info(url, use_cache)
+            finally:
+                extract_seconds.append(time.perf_counter() - started)
+
+        def recorded_playlist(url, start=1, end=None, limit=None):
+            # What flat extraction of the playlist page would yield
+            for index, entry_url in enumerate(urls[start - 1:end], start):
+                if limit is not None and index - start >= limit:
+                    return
+                yield {'url': entry_url, 'id': main.extract_video_id(entry_url), 'title': None}
+
+        main.get_video_info = timed_get_video_info
+        main.iter_playlist_entries = recorded_playlist
+        main.autotune_state['enabled'] = scenario == 'dash'
+        quality = config.get('quality', '1080p')
+        started = time.perf_counter()
+        if scenario == 'single':
+            # Same steps as the interactive prompt
+            info = main.get_video_info(urls[0])
+            record = main.compact_video_record(info, main.select_video_format(info, quality))
+            del info
+            ok = main.download_video_with_audio(urls[0], record.video_format['format_id'], output_dir,
+                                                f"{main.format_filename(record.title)}.mp4",
+                                                record.download_info, quality, record.estimated_bytes)
+            results['failed'] = 0 if ok else 1
+        else:
+            items = main.expand_urls([E2E_PLAYLIST_URL]) if scenario == 'playlist' else urls
+            jobs = main.run_batch(items, workers, output_dir)
+            results['failed'] = sum(job['status'] != 'done' for job in jobs)
+            if scenario == 'dash':
+                results['fragment_concurrency'] = main.autotune_state['concurrency']
+        results['seconds'] = time.perf_counter() - started
+        histograms = main.metrics_state['histograms']
+        results['stages'] = {'extract': sum(extract_seconds)}
+        for phase in ('fetch_video', 'fetch_audio', 'merge'):
+            results['stages'][phase] = histograms.get(phase, {}).get('sum', 0.0)
+        results['bytes'] = sum(os.path.getsize(os.path.join(output_dir, name))
+                               for name in os.listdir(output_dir) if name.endswith('.mp4'))
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    results.update({'cpu_seconds': own.ru_utime + own.ru_stime,
+                    'ffmpeg_cpu_seconds': children.ru_utime + children.ru_stime,
+                    'peak_bytes': peak_rss_bytes()})
+    print(json.dumps(results))
+
+def run_e2e(args):
+    if sys.platform == 'win32':
+        print("❌ The end-to-end benchmark needs a POSIX system (Linux or macOS)")
+        return 2
+    scenarios = args.scenario or list(E2E_SCENARIOS)
+    print(f"🏁 End-to-end benchmark ({args.videos} videos of {args.video_mb:g}+{args.audio_mb:g} MB, "
+          f"{args.jobs} jobs, offline)")
+    script = FAKE_FFMPEG.format(python=sys.executable)
+    ffmpeg_zip = build_ffmpeg_zip(script, int(args.ffmpeg_mb * 2**20))
+    results = []
+    ok = True
+    with tempfile.TemporaryDirectory() as workdir, media_server(ffmpeg_zip) as base_url:
+        ffmpeg_path = os.path.join(workdir, 'ffmpeg')
+        with open(ffmpeg_path, 'w', encoding='utf-8') as f:
+            f.write(script)
+        os.chmod(ffmpeg_path, 0o755)
+        for scenario in scenarios:
+            home = tempfile.mkdtemp(dir=workdir)
+            code = (f"import benchmark; benchmark.run_scenario({scenario!r}, {base_url!r}, {args.videos}, "
+                    f"{args.jobs}, {int(args.video_mb * 2**20)}, {int(args.audio_mb * 2**20)}, {ffmpeg_path!r})")
+            proc = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, env=offline_env(home),
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"❌ {scenario} crashed:\n{proc.stderr.strip()[-2000:]}")
+                ok = False
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            if scenario == 'bootstrap':
+                result['bytes'] = len(ffmpeg_zip)
+            results.append(result)
+    for r in results:
+        mb_per_s = r['bytes'] / 2**20 / r['seconds'] if r['seconds'] else 0
+        stages = '  '.join(f"{name} {seconds:.2f}s" for name, seconds in r['stages'].items())
+        if r.get('fragment_concurrency'):
+            stages += f"  (tuned to {r['fragment_concurrency']} concurrent fragments)"
+        print(f"   {r['scenario']:<10} {r['seconds']:7.2f} s  {r['bytes'] / 2**20:8.1f} MB  {mb_per_s:7.1f} MB/s  "
+              f"cpu {r['cpu_seconds']:6.2f} s (+{r['ffmpeg_cpu_seconds']:.2f} s ffmpeg)  "
+              f"peak RSS {r['peak_bytes'] / 2**20:6.1f} MB")
+        print(f"   {'':<10} {stages}")
+        r['mb_per_second'] = mb_per_s
+        if r['failed']:
+            print(f"❌ {r['scenario']}: {r['failed']} download(s) failed")
+            ok = False
+        if args.min_mbps is not None and mb_per_s < args.min_mbps:
+            print(f"❌ {r['scenario']} throughput regressed: {mb_per_s:.1f} MB/s < {args.min_mbps:.1f} MB/s")
+            ok = False
+        if args.max_peak_mb is not None and r['peak_bytes'] / 2**20 > args.max_peak_mb:
+            print(f"❌ {r['scenario']} peak RSS regressed: {r['peak_bytes'] / 2**20:.1f} MB > {args.max_peak_mb:.1f} MB")
+            ok = False
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0 if ok else 1
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="YouTube Video Downloader benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    startup = subparsers.add_parser('startup', help="import time and time to the first prompt")
+    startup.add_argument('--runs', type=int, default=10)
+    startup.add_argument('--max-import-ms', type=float, default=None,
+                         help="fail if the median import time exceeds this")
+    startup.add_argument('--max-prompt-ms', type=float, default=None,
+                         help="fail if the median time to first prompt exceeds this")
+    startup.set_defaults(func=run_startup)
+    memory = subparsers.add_parser('memory', help="peak RSS with many resolved videos queued")
+    memory.add_argument('--entries', type=int, default=10000)
+    memory.add_argument('--max-peak-mb', type=float, default=None,
+                        help="fail if the peak RSS with compact records exceeds this")
+    memory.set_defaults(func=run_memory)
+    e2e = subparsers.add_parser('e2e', help="offline downloads from a local fake media server")
+    e2e.add_argument('--scenario', action='append', choices=E2E_SCENARIOS,
+                     help="run only this scenario (repeatable; default all)")
+    e2e.add_argument('--videos', type=int, default=8, help="videos in the batch and playlist runs")
+    e2e.add_argument('--jobs', type=int, default=4)
+    e2e.add_argument('--video-mb', type=float, default=40)
+    e2e.add_argument('--audio-mb', type=float, default=4)
+    e2e.add_argument('--ffmpeg-mb', type=float, default=64, help="size of the fake FFmpeg zip")
+    e2e.add_argument('--json', metavar='FILE', help="write the results to FILE")
+    e2e.add_argument('--min-mbps', type=float, default=None,
+                     help="fail if any scenario's throughput (MB/s) falls below this")
+    e2e.add_argument('--max-peak-mb', type=float, default=None,
+                     help="fail if any scenario's peak RSS exceeds this")
+    e2e.set_defaults(func=run_e2e)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    sys.exit(args.func(args))
+
+if __name__ == "__main__":
+    main()
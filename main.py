@@ -2,16 +2,20 @@ import os
 import sys
 import re
 import subprocess
-import zipfile
-import urllib.request
 import tempfile
+import hashlib
+import shutil
 from urllib.parse import urlparse
-import requests
-import yt_dlp
 import threading
 import time
-from tqdm import tqdm
+import queue
+import argparse
 import json
+import heapq
+import contextlib
+import errno
+# yt_dlp, tqdm, zipfile and urllib.request are imported where they are used,
+# so start-up (and --help / batch scripting) doesn't pay for them
 
 # --- User data directory for ffmpeg ---
 def get_userdata_ffmpeg_dir():
@@ -24,149 +28,342 @@ def get_userdata_ffmpeg_dir():
         # For Linux/Mac
         return os.path.expanduser('~/.local/share/YouTubeDownloader/ffmpeg')
 
+FFMPEG_EXE_NAME = 'ffmpeg.exe' if sys.platform == 'win32' else 'ffmpeg'
+# Fastest first: Apple AudioToolbox, Fraunhofer FDK, then FFmpeg's native encoder
+AAC_ENCODER_PREFERENCE = ['aac_at', 'libfdk_aac', 'aac']
+
+ffmpeg_probes = {}
+ffmpeg_probe_lock = threading.Lock()
+
+def find_ffmpeg():
+    """Locate FFmpeg: configured path, then the user data dir, then PATH"""
+    configured = load_config().get('ffmpeg_path')
+    if configured and os.path.isfile(configured):
+        return configured
+    local_ffmpeg = os.path.join(get_userdata_ffmpeg_dir(), FFMPEG_EXE_NAME)
+    if os.path.isfile(local_ffmpeg):
+        return local_ffmpeg
+    return shutil.which('ffmpeg')
+
+def get_probe_cache_path():
+    return os.path.join(get_userdata_config_dir(), 'ffmpeg_probe.json')
+
+def run_ffmpeg_query(ffmpeg_path, flag):
+    result = subprocess.run([ffmpeg_path, '-hide_banner', flag],
+                            capture_output=True, text=True, timeout=10)
+    if result.returncode != 0:
+        raise subprocess.SubprocessError(result.stderr.strip())
+    return result.stdout
+
+def run_ffmpeg_probe(ffmpeg_path):
+    """Spawn FFmpeg to read its version, encoders and muxers"""
+    version_out = run_ffmpeg_query(ffmpeg_path, '-version')
+    match = re.search(r'version\s+(\S+)', version_out)
+    encoders = []
+    for line in run_ffmpeg_query(ffmpeg_path, '-encoders').splitlines():
+        # " A....D aac    AAC (Advanced Audio Coding)"
+        match_enc = re.match(r'^\s*([VASFXBD.]{6})\s+(\S+)', line)
+        if match_enc and match_enc.group(2) != '=':
+            encoders.append(match_enc.group(2))
+    muxers = []
+    for line in run_ffmpeg_query(ffmpeg_path, '-muxers').splitlines():
+        # "  E mp4   MP4 (MPEG-4 Part 14)"
+        match_mux = re.match(r'^\s*D?E\s+(\S+)', line)
+        if match_mux and match_mux.group(1) != '=':
+            muxers.extend(match_mux.group(1).split(','))
+    return {
+        'version': match.group(1) if match else 'unknown',
+        'encoders': encoders,
+        'muxers': muxers,
+    }
+
+def probe_ffmpeg(ffmpeg_path):
+    """Return FFmpeg's version and capabilities, or None if it does not run.
+
+    Results are cached on disk keyed by path, size and mtime, so the binary is only
+    spawned again after it changes.
+    """
+    try:
+        stat = os.stat(ffmpeg_path)
+    except OSError:
+        return None
+    key = os.path.abspath(ffmpeg_path)
+    with ffmpeg_probe_lock:
+        probe = ffmpeg_probes.get(key)
+        if probe and probe['mtime'] == stat.st_mtime and probe['size'] == stat.st_size:
+            return probe
+        cache_path = get_probe_cache_path()
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+        probe = cached.get(key)
+        if not probe or probe.get('mtime') != stat.st_mtime or probe.get('size') != stat.st_size:
+            try:
+                probe = run_ffmpeg_probe(ffmpeg_path)
+            except (OSError, subprocess.SubprocessError):
+                return None
+            probe.update({'mtime': stat.st_mtime, 'size': stat.st_size})
+            cached[key] = probe
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                temp_path = cache_path + '.tmp'
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(cached, f)
+                os.replace(temp_path, cache_path)
+            except OSError:
+                pass
+        ffmpeg_probes[key] = probe
+        return probe
+
 def check_ffmpeg():
-    """Check if our downloaded FFmpeg is available"""
-    # Only check for our downloaded FFmpeg, not system PATH
-    local_ffmpeg = os.path.join(get_userdata_ffmpeg_dir(), 'ffmpeg.exe')
-    if os.path.exists(local_ffmpeg):
+    """Check if a working FFmpeg is available"""
+    ffmpeg_path = find_ffmpeg()
+    return bool(ffmpeg_path and probe_ffmpeg(ffmpeg_path))
+
+def pick_aac_encoder(ffmpeg_path):
+    """Fastest AAC encoder this FFmpeg build provides"""
+    probe = probe_ffmpeg(ffmpeg_path) or {}
+    encoders = probe.get('encoders') or []
+    for encoder in AAC_ENCODER_PREFERENCE:
+        if encoder in encoders:
+            return encoder
+    return 'aac'
+
+# FFmpeg download sources, each with the checksum file published next to it
+FFMPEG_SOURCES = [
+    {
+        'url': "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip",
+        'checksum_url': "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/checksums.sha256",
+    },
+    {
+        'url': "https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip",
+        'checksum_url': "https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip.sha256",
+    },
+    {
+        'url': "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl-shared.zip",
+        'checksum_url': "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/checksums.sha256",
+    },
+]
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024       # 1MB reads
+RANGE_SEGMENTS = 4                      # parallel Range requests per download
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024      # don't split downloads smaller than this
+HTTP_TIMEOUT = 30
+
+def fetch_expected_checksum(checksum_url, file_url):
+    """Fetch the published SHA-256 for file_url from a checksum file"""
+    import urllib.request
+    with urllib.request.urlopen(checksum_url, timeout=HTTP_TIMEOUT) as response:
+        text = response.read().decode('utf-8', 'replace')
+    file_name = os.path.basename(urlparse(file_url).path)
+    for line in text.splitlines():
+        parts = line.split()
+        # Either "<hash>" alone or "<hash>  <filename>" (sha256sum format)
+        if len(parts) == 1 and re.fullmatch(r'[0-9a-fA-F]{64}', parts[0]):
+            return parts[0].lower()
+        if len(parts) == 2 and parts[1].lstrip('*') == file_name:
+            return parts[0].lower()
+    raise Exception(f"No checksum listed for {file_name}")
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_segment_state(state_path, url):
+    """Return the saved segment list for a resumable download of url, or None"""
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('url') != url:
+        return None
+    return state
+
+def save_segment_state(state_path, state, lock):
+    with lock:
+        temp_path = state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, state_path)
+
+def plan_segments(total):
+    """Split [0, total) into up to RANGE_SEGMENTS [start, end, written] ranges"""
+    count = max(1, min(RANGE_SEGMENTS, total // MIN_SEGMENT_SIZE))
+    size = -(-total // count)
+    return [[start, min(start + size, total) - 1, 0] for start in range(0, total, size)]
+
+def open_range(url, start, end=None):
+    import urllib.request
+    request = urllib.request.Request(url, headers={'Range': f"bytes={start}-{'' if end is None else end}"})
+    return urllib.request.urlopen(request, timeout=HTTP_TIMEOUT)
+
+def download_file(url, dest_path, desc="Downloading"):
+    """Download url to dest_path with one request per range and resume support.
+
+    If the server honours Range requests the file is fetched in parallel segments and
+    progress is recorded in a sidecar file so an interrupted download picks up where it
+    stopped. Otherwise the single response is streamed sequentially.
+    """
+    from tqdm import tqdm
+    part_path = dest_path + '.part'
+    state_path = dest_path + '.part.json'
+    lock = threading.Lock()
+    state = load_segment_state(state_path, url) if os.path.exists(part_path) else None
+
+    if state:
+        pending = [seg for seg in state['segments'] if seg[0] + seg[2] <= seg[1]]
+        first = pending[0] if pending else None
+        response = open_range(url, first[0] + first[2], first[1]) if first else None
+    else:
+        pending = []
+        first = None
+        response = open_range(url, 0)
+
+    if response is not None and response.status != 206:
+        # No range support: stream the whole body from this one response
+        state = None
+        total = int(response.headers.get('content-length', 0))
+        with response, open(part_path, 'wb') as f, \
+                tqdm(total=total, unit='B', unit_scale=True, desc=desc, ncols=80) as pbar:
+            for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK_SIZE), b''):
+                f.write(chunk)
+                pbar.update(len(chunk))
+        if os.path.exists(state_path):
+            os.unlink(state_path)
+        os.replace(part_path, dest_path)
+        return dest_path
+
+    if not state:
+        content_range = response.headers.get('content-range', '')
+        match = re.search(r'/(\d+)$', content_range)
+        if not match:
+            response.close()
+            raise Exception("Server did not report the file size")
+        total = int(match.group(1))
+        state = {'url': url, 'total': total, 'segments': plan_segments(total)}
+        with open(part_path, 'wb') as f:
+            f.truncate(total)
+        save_segment_state(state_path, state, lock)
+        pending = state['segments']
+        first = pending[0]
+
+    done_bytes = sum(seg[2] for seg in state['segments'])
+    pbar = tqdm(total=state['total'], initial=done_bytes, unit='B', unit_scale=True, desc=desc, ncols=80)
+    errors = []
+
+    def fetch_segment(seg, seg_response):
         try:
-            result = subprocess.run([local_ffmpeg, '-version'], 
-                                  capture_output=True, text=True, timeout=5)
-            return result.returncode == 0
-        except (subprocess.TimeoutExpired, FileNotFoundError, subprocess.SubprocessError):
-            return False
-    return False
+            if seg_response is None:
+                seg_response = open_range(url, seg[0] + seg[2], seg[1])
+            with seg_response, open(part_path, 'r+b') as f:
+                f.seek(seg[0] + seg[2])
+                remaining = seg[1] - seg[0] + 1 - seg[2]
+                while remaining > 0:
+                    chunk = seg_response.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise Exception("Connection closed before the segment finished")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+                    with lock:
+                        seg[2] += len(chunk)
+                    pbar.update(len(chunk))
+                    save_segment_state(state_path, state, lock)
+        except Exception as e:
+            errors.append(e)
+
+    # The first pending segment reuses the response we already have open
+    threads = [threading.Thread(target=fetch_segment, args=(seg, response if seg is first else None))
+               for seg in pending]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    pbar.close()
+    if errors:
+        raise errors[0]
+    os.unlink(state_path)
+    os.replace(part_path, dest_path)
+    return dest_path
+
+def find_ffmpeg_member(zip_ref):
+    """Name of the ffmpeg.exe member in the archive, preferring the bin/ folder"""
+    candidates = [name for name in zip_ref.namelist() if name.replace('\\', '/').split('/')[-1] == 'ffmpeg.exe']
+    candidates.sort(key=lambda name: ('/bin/' not in f'/{name}', len(name)))
+    return candidates[0] if candidates else None
 
-def download_ffmpeg():
-    """Download and install FFmpeg for Windows with progress bar (to user data dir)"""
+def download_ffmpeg(sources=None, ffmpeg_dir=None):
+    """Download and install FFmpeg for Windows with progress bar (to user data dir).
+
+    The archive is verified against the published SHA-256 and only ffmpeg.exe is
+    extracted from it. Interrupted downloads are resumed on the next run.
+    """
+    import zipfile
     print("🔧 FFmpeg not found. Downloading and installing FFmpeg...")
+    sources = sources or FFMPEG_SOURCES
+    ffmpeg_dir = ffmpeg_dir or get_userdata_ffmpeg_dir()
     try:
-        ffmpeg_dir = get_userdata_ffmpeg_dir()
         os.makedirs(ffmpeg_dir, exist_ok=True)
-        
-        # Try multiple FFmpeg download URLs (more reliable)
-        ffmpeg_urls = [
-            "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip",
-            "https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip",
-            "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl-shared.zip"
-        ]
-        
-        temp_file = None
-        successful_download = False
-        
-        for url_index, ffmpeg_url in enumerate(ffmpeg_urls, 1):
-            try:
-                print(f"📥 Attempting download from source {url_index}/{len(ffmpeg_urls)}...")
-                
-                # Get file size for progress bar
-                with urllib.request.urlopen(ffmpeg_url) as response:
-                    file_size = int(response.headers.get('content-length', 0))
-                
-                # Download FFmpeg with progress bar
-                temp_file = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
-                
-                with urllib.request.urlopen(ffmpeg_url) as response:
-                    with tqdm(total=file_size, unit='B', unit_scale=True, 
-                             desc=f"Downloading FFmpeg (Source {url_index})", ncols=80) as pbar:
-                        while True:
-                            chunk = response.read(8192)  # 8KB chunks
-                            if not chunk:
-                                break
-                            temp_file.write(chunk)
-                            pbar.update(len(chunk))
-                
-                temp_file.close()
-                
-                # Verify it's actually a zip file
-                try:
-                    with zipfile.ZipFile(temp_file.name, 'r') as test_zip:
-                        # Try to read the file list to verify it's valid
-                        test_zip.namelist()
-                    successful_download = True
-                    print(f"✅ Successfully downloaded from source {url_index}")
-                    break
-                except zipfile.BadZipFile:
-                    print(f"❌ Source {url_index} failed - not a valid zip file")
-                    os.unlink(temp_file.name)
-                    temp_file = None
-                    continue
-                    
-            except Exception as e:
-                print(f"❌ Source {url_index} failed: {str(e)}")
-                if temp_file:
-                    os.unlink(temp_file.name)
-                    temp_file = None
-                continue
-        
-        if not successful_download or not temp_file:
-            raise Exception("All download sources failed")
-        
-        print("📦 Extracting FFmpeg...")
-        
-        # Extract the zip file
-        with zipfile.ZipFile(temp_file.name, 'r') as zip_ref:
-            file_list = zip_ref.namelist()
-            with tqdm(total=len(file_list), desc="Extracting FFmpeg", ncols=80) as pbar:
-                for file in file_list:
-                    zip_ref.extract(file, ffmpeg_dir)
-                    pbar.update(1)
-        
-        # Clean up temp file
-        os.unlink(temp_file.name)
-        
-        # Find the extracted folder (it has a random name)
-        extracted_folders = [f for f in os.listdir(ffmpeg_dir) 
-                           if os.path.isdir(os.path.join(ffmpeg_dir, f))]
-        
-        if not extracted_folders:
-            raise Exception("Could not find extracted FFmpeg folder")
-        
-        # Look for ffmpeg.exe in various possible locations
-        possible_ffmpeg_paths = []
-        for folder in extracted_folders:
-            source_folder = os.path.join(ffmpeg_dir, folder)
-            possible_paths = [
-                os.path.join(source_folder, 'bin', 'ffmpeg.exe'),
-                os.path.join(source_folder, 'ffmpeg.exe'),
-                os.path.join(source_folder, 'bin', 'ffmpeg', 'ffmpeg.exe')
-            ]
-            for path in possible_paths:
-                if os.path.exists(path):
-                    possible_ffmpeg_paths.append((path, source_folder))
-        
-        if not possible_ffmpeg_paths:
-            raise Exception("FFmpeg executable not found in downloaded files")
-        
-        # Use the first found ffmpeg.exe
-        ffmpeg_exe_path, source_folder = possible_ffmpeg_paths[0]
-        
-        # Copy ffmpeg.exe to the main directory
-        import shutil
-        final_ffmpeg_path = os.path.join(ffmpeg_dir, 'ffmpeg.exe')
-        shutil.copy2(ffmpeg_exe_path, final_ffmpeg_path)
-        
-        # Clean up extracted folder
-        shutil.rmtree(source_folder)
-        
-        print("✅ FFmpeg installed successfully!")
-        return final_ffmpeg_path
-        
-    except Exception as e:
+    except OSError as e:
         print(f"❌ Failed to download FFmpeg: {str(e)}")
-        # Clean up any partial downloads
-        if 'temp_file' in locals() and temp_file and os.path.exists(temp_file.name):
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
         return None
 
+    for source_index, source in enumerate(sources, 1):
+        # Keep the partial download in the ffmpeg dir so it can be resumed later
+        url_hash = hashlib.sha256(source['url'].encode('utf-8')).hexdigest()[:12]
+        zip_path = os.path.join(ffmpeg_dir, f'ffmpeg-{url_hash}.zip')
+        try:
+            print(f"📥 Attempting download from source {source_index}/{len(sources)}...")
+            expected = fetch_expected_checksum(source['checksum_url'], source['url'])
+            if not os.path.exists(zip_path):
+                download_file(source['url'], zip_path, desc=f"Downloading FFmpeg (Source {source_index})")
+            
+            print("🔐 Verifying checksum...")
+            if sha256_file(zip_path) != expected:
+                os.unlink(zip_path)
+                print(f"❌ Source {source_index} failed - checksum mismatch")
+                continue
+            
+            print("📦 Extracting FFmpeg...")
+            final_ffmpeg_path = os.path.join(ffmpeg_dir, 'ffmpeg.exe')
+            temp_ffmpeg_path = final_ffmpeg_path + '.tmp'
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                member = find_ffmpeg_member(zip_ref)
+                if not member:
+                    raise Exception("FFmpeg executable not found in downloaded files")
+                with zip_ref.open(member) as src, open(temp_ffmpeg_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+            os.replace(temp_ffmpeg_path, final_ffmpeg_path)
+            os.unlink(zip_path)
+            
+            print("✅ FFmpeg installed successfully!")
+            return final_ffmpeg_path
+        except zipfile.BadZipFile:
+            print(f"❌ Source {source_index} failed - not a valid zip file")
+            if os.path.exists(zip_path):
+                os.unlink(zip_path)
+        except Exception as e:
+            # Partial downloads are kept so the next attempt can resume them
+            print(f"❌ Source {source_index} failed: {str(e)}")
+    
+    print("❌ Failed to download FFmpeg: All download sources failed")
+    return None
+
 def get_ffmpeg_path():
-    """Get FFmpeg path, download if not available (user data dir only)"""
-    # First check if our downloaded FFmpeg exists
-    local_ffmpeg = os.path.join(get_userdata_ffmpeg_dir(), 'ffmpeg.exe')
-    if os.path.exists(local_ffmpeg):
-        return local_ffmpeg
+    """Get FFmpeg path (configured path, user data dir or PATH); download it on Windows if missing"""
+    ffmpeg_path = find_ffmpeg()
+    if ffmpeg_path:
+        return ffmpeg_path
+    
+    # The downloadable builds are Windows-only
+    if sys.platform != 'win32':
+        print("❌ FFmpeg not found. Install it with your package manager (e.g. 'apt install ffmpeg' "
+              "or 'brew install ffmpeg') or set 'ffmpeg_path' in the config.")
+        return None
     
     # Download FFmpeg if not found
     ffmpeg_path = download_ffmpeg()
@@ -189,172 +386,1039 @@ def print_banner():
     """
     print(banner)
 
+YOUTUBE_PLAYLIST_PATTERNS = [
+    r'(?:https?://)?(?:www\.|m\.)?youtube\.com/playlist\?(?:.*&)?list=[\w-]+',
+    r'(?:https?://)?(?:www\.|m\.)?youtube\.com/@[\w.-]+',
+    r'(?:https?://)?(?:www\.|m\.)?youtube\.com/(?:channel|c|user)/[\w-]+',
+]
+
+def is_playlist_url(url):
+    """Check if the URL is a YouTube playlist or channel URL"""
+    for pattern in YOUTUBE_PLAYLIST_PATTERNS:
+        if re.match(pattern, url):
+            return True
+    return False
+
 def is_valid_youtube_url(url):
-    """Check if the URL is a valid YouTube URL"""
+    """Check if the URL is a valid YouTube video, playlist or channel URL"""
     youtube_patterns = [
         r'(?:https?://)?(?:www\.)?youtube\.com/watch\?v=[\w-]+',
         r'(?:https?://)?(?:www\.)?youtu\.be/[\w-]+',
         r'(?:https?://)?(?:www\.)?youtube\.com/embed/[\w-]+',
-        r'(?:https?://)?(?:www\.)?youtube\.com/v/[\w-]+'
+        r'(?:https?://)?(?:www\.)?youtube\.com/v/[\w-]+',
+        r'(?:https?://)?(?:www\.|m\.)?youtube\.com/shorts/[\w-]+'
     ]
     
     for pattern in youtube_patterns:
         if re.match(pattern, url):
             return True
-    return False
+    return is_playlist_url(url)
+
+def iter_playlist_entries(url, start=1, end=None, limit=None):
+    """Yield the videos of a playlist or channel as they are paged in.
+
+    Uses flat extraction, so each entry is only {'url', 'id', 'title'}; full extraction
+    happens later, when a worker picks the entry up. start and end are 1-based and
+    inclusive (like yt-dlp's --playlist-start/--playlist-end); limit caps the count.
+    """
+    import yt_dlp
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }
+    index = 0
+    yielded = 0
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        pending = [url]
+        while pending:
+            # process=False keeps 'entries' as the extractor's lazy, page-by-page generator
+            result = ydl.extract_info(pending.pop(0), download=False, process=False)
+            if result.get('_type') in ('url', 'url_transparent') and result.get('ie_key') != 'Youtube':
+                pending.insert(0, result['url'])
+                continue
+            for entry in result.get('entries') or []:
+                if not entry:
+                    continue
+                if entry.get('ie_key') == 'YoutubeTab' or entry.get('_type') == 'playlist':
+                    # Channel pages list their tabs/playlists; expand those in order
+                    pending.append(entry.get('url') or entry.get('webpage_url'))
+                    continue
+                index += 1
+                if index < start:
+                    continue
+                if (end is not None and index > end) or (limit is not None and yielded >= limit):
+                    return
+                video_id = entry.get('id')
+                yield {
+                    'url': entry.get('url') or f'https://www.youtube.com/watch?v={video_id}',
+                    'id': video_id,
+                    'title': entry.get('title'),
+                }
+                yielded += 1
+
+def expand_urls(urls, start=1, end=None, limit=None):
+    """Yield (url, priority) pairs, lazily expanding playlist and channel URLs.
+
+    urls may hold plain URLs or (url, priority) pairs; playlist entries inherit the priority.
+    """
+    for item in urls:
+        url, priority = item if isinstance(item, tuple) else (item, 1)
+        if not is_playlist_url(url):
+            yield url, priority
+            continue
+        try:
+            for entry in iter_playlist_entries(url, start, end, limit):
+                yield entry['url'], priority
+        except Exception as e:
+            print(f"❌ Could not expand playlist {url}: {str(e)}")
+
+def extract_video_id(url):
+    """Return the 11-character YouTube video ID from a URL, or None"""
+    match = re.search(r'(?:[?&]v=|youtu\.be/|/embed/|/v/|/shorts/)([\w-]{11})', url)
+    return match.group(1) if match else None
+
+# --- Metadata cache ---
+# Stable metadata (title, duration, format ladder) is kept for the configured TTL.
+# Stream URLs expire after a few hours, so they are stored separately with their
+# own expiry and only re-resolved once stale.
+STABLE_INFO_FIELDS = ('id', 'title', 'uploader', 'duration', 'view_count', 'upload_date',
+                      'webpage_url', 'extractor', 'extractor_key')
+STABLE_FORMAT_FIELDS = ('format_id', 'ext', 'filesize', 'filesize_approx', 'format_note',
+                        'height', 'width', 'fps', 'vcodec', 'acodec', 'tbr', 'abr', 'vbr', 'asr')
+STREAM_URL_TTL = 5 * 3600      # used when a URL carries no expire= parameter
+STREAM_URL_MARGIN = 10 * 60    # treat URLs as stale this long before they actually expire
+
+cache_stats = {'hits': 0, 'stale_urls': 0, 'misses': 0}
+cache_lock = threading.Lock()
+# Entries in the cache dir, counted once and then tracked, so writes don't list the dir
+cache_state = {'dir': None, 'count': 0}
+CACHE_EVICT_RATIO = 0.9  # evict down to this share of max_entries, so eviction is rare
+
+def get_cache_dir():
+    return os.path.join(get_userdata_config_dir(), 'cache')
+
+def count_cache(event):
+    with cache_lock:
+        cache_stats[event] += 1
 
-def get_video_info(url):
-    """Get video information from YouTube URL"""
+def stream_urls_expiry(formats):
+    """Earliest expiry timestamp of the stream URLs in a format list"""
+    expiry = time.time() + STREAM_URL_TTL
+    for fmt in formats:
+        for key in ('url', 'manifest_url', 'fragment_base_url'):
+            value = fmt.get(key)
+            if not value:
+                continue
+            match = re.search(r'[?&/]expire[=/](\d+)', value)
+            if match:
+                expiry = min(expiry, int(match.group(1)))
+    return expiry - STREAM_URL_MARGIN
+
+def split_info_for_cache(info):
+    """Split an info dict into stable metadata and short-lived stream data"""
+    stable = {key: info[key] for key in STABLE_INFO_FIELDS if info.get(key) is not None}
+    stable['formats'] = []
+    streams = {}
+    for fmt in info.get('formats') or []:
+        stable['formats'].append({key: fmt[key] for key in STABLE_FORMAT_FIELDS
+                                  if fmt.get(key) is not None})
+        streams[fmt.get('format_id')] = {key: value for key, value in fmt.items()
+                                         if key not in STABLE_FORMAT_FIELDS}
+    return {
+        'cached_at': time.time(),
+        'stable': stable,
+        'streams': streams,
+        'streams_expire': stream_urls_expiry(info.get('formats') or []),
+    }
+
+def info_has_stream_urls(info):
+    """True if every format in the info dict can be downloaded without re-extraction"""
+    formats = info.get('formats')
+    return bool(formats) and all(fmt.get('url') for fmt in formats)
+
+def read_cached_info(video_id, ttl):
+    """Return (info, urls_fresh) from the cache, or (None, False) on a miss"""
+    path = os.path.join(get_cache_dir(), f'{video_id}.json')
     try:
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None, False
+    now = time.time()
+    if now - entry.get('cached_at', 0) > ttl:
+        return None, False
+    # Bump mtime so eviction drops the least recently used entries first
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    info = dict(entry['stable'])
+    urls_fresh = now < entry.get('streams_expire', 0)
+    if urls_fresh:
+        info['formats'] = [dict(entry['streams'].get(fmt['format_id'], {}), **fmt)
+                           for fmt in info['formats']]
+    return info, urls_fresh
+
+def write_cached_info(video_id, info, max_entries):
+    """Atomically store an info dict in the cache, evicting old entries once the entry
+    count goes over max_entries"""
+    cache_dir = get_cache_dir()
+    path = os.path.join(cache_dir, f'{video_id}.json')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(split_info_for_cache(info), f)
+        with cache_lock:
+            if cache_state['dir'] != cache_dir:
+                cache_state.update({'dir': cache_dir, 'count': len(list_cache_entries(cache_dir))})
+            added = not os.path.exists(path)
+            os.replace(temp_path, path)
+            if added:
+                cache_state['count'] += 1
+            if cache_state['count'] > max_entries:
+                cache_state['count'] = evict_cache(cache_dir, int(max_entries * CACHE_EVICT_RATIO))
+    except (OSError, TypeError, ValueError):
+        pass
+
+def refresh_cached_info(url, info):
+    """Store the info dict of a download that had to extract the URL again (the cached
+    stream URLs had expired), so the next run gets fresh stream URLs from the cache"""
+    config = load_config()
+    video_id = (info or {}).get('id') or extract_video_id(url or '')
+    if not video_id or not config.get('cache_enabled', True) or not info_has_stream_urls(info):
+        return
+    write_cached_info(video_id, info, config.get('cache_max_entries', 5000))
+
+def list_cache_entries(cache_dir):
+    return [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.json')]
+
+def evict_cache(cache_dir, max_entries):
+    """Remove least recently used entries beyond max_entries; returns the entries left"""
+    entries = []
+    for path in list_cache_entries(cache_dir):
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+    if len(entries) <= max_entries:
+        return len(entries)
+    entries.sort()
+    for _, path in entries[:len(entries) - max_entries]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return max_entries
+
+# Extraction-only YoutubeDL instances are reused across calls instead of being built per
+# URL, so the initialised extractors (and YouTube's cached player code) and the pooled
+# HTTP connections stay warm for the next video. Each instance serves one thread at a time.
+EXTRACT_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+}
+ydl_pool = []
+ydl_pool_lock = threading.Lock()
+
+@contextlib.contextmanager
+def pooled_extractor():
+    """Borrow a warm extraction YoutubeDL from the pool, creating one if none is idle"""
+    with ydl_pool_lock:
+        ydl = ydl_pool.pop() if ydl_pool else None
+    if ydl is None:
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(dict(EXTRACT_OPTS))
+    try:
+        yield ydl
+    except Exception:
+        # A failed extraction may leave the instance in a bad state; don't reuse it
+        ydl.close()
+        raise
+    with ydl_pool_lock:
+        if len(ydl_pool) < MAX_BATCH_WORKERS:
+            ydl_pool.append(ydl)
+            return
+    ydl.close()
+
+def get_video_info(url, use_cache=True):
+    """Get video information from YouTube URL, using the on-disk metadata cache when possible.
+
+    If only the cached stream URLs have expired, the stable metadata is returned without
+    them and the download step re-resolves the URL.
+    """
+    config = load_config()
+    video_id = extract_video_id(url)
+    use_cache = use_cache and video_id and config.get('cache_enabled', True)
+    cache_events.event = None
+    if use_cache:
+        info, urls_fresh = read_cached_info(video_id, config.get('cache_ttl_hours', 24) * 3600)
+        if info:
+            cache_events.event = 'hit' if urls_fresh else 'stale_urls'
+            count_cache('hits' if urls_fresh else 'stale_urls')
             return info
+        cache_events.event = 'miss'
+        count_cache('misses')
+    try:
+        started = time.monotonic()
+        with pooled_extractor() as ydl:
+            info = ydl.extract_info(url, download=False)
+        observe_phase('extract', time.monotonic() - started)
+        if use_cache and info:
+            write_cached_info(video_id, info, config.get('cache_max_entries', 5000))
+        return info
     except Exception as e:
         print(f"❌ Error getting video info: {str(e)}")
         return None
 
-def display_video_info(info):
+# --- Download archive ---
+# Append-only index of finished downloads, one "youtube <video_id> <quality> <format_id>"
+# line each. It is loaded into a set once and then only the newly appended tail is read,
+# so lookups are O(1) and other processes' appends are picked up. Each entry is written
+# with a single O_APPEND write, which keeps concurrent appends from interleaving.
+ARCHIVE_ANY_QUALITY = '*'  # entries rebuilt from files, whose quality setting is unknown
+
+archive_state = {'path': None, 'keys': set(), 'offset': 0}
+archive_lock = threading.Lock()
+
+def get_archive_path():
+    return os.path.join(get_userdata_config_dir(), 'archive.txt')
+
+def refresh_archive():
+    """Read entries appended since the last refresh (by any process)"""
+    path = get_archive_path()
+    if archive_state['path'] != path:
+        archive_state.update({'path': path, 'keys': set(), 'offset': 0})
+    try:
+        with open(path, 'rb') as f:
+            f.seek(archive_state['offset'])
+            data = f.read()
+    except OSError:
+        return
+    # Only consume complete lines; a concurrent writer may be mid-append
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].decode('utf-8', 'replace').splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and parts[0] == 'youtube':
+            archive_state['keys'].add((parts[1], parts[2]))
+    archive_state['offset'] += end
+
+def is_archived(video_id, quality):
+    """True if this video was already downloaded at this quality setting"""
+    if not video_id:
+        return False
+    with archive_lock:
+        refresh_archive()
+        keys = archive_state['keys']
+        return (video_id, quality) in keys or (video_id, ARCHIVE_ANY_QUALITY) in keys
+
+def record_archive(video_id, quality, format_id):
+    """Atomically append a finished download to the archive"""
+    if not video_id:
+        return
+    path = get_archive_path()
+    line = f"youtube {video_id} {quality} {format_id or '-'}\n".encode('utf-8')
+    with archive_lock:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"⚠️  Could not update download archive: {str(e)}")
+
+def read_video_id_from_file(ffmpeg_path, path):
+    """Video ID from the comment tag written at merge time, or a yt-dlp style [ID] in the name"""
+    match = re.search(r'\[([\w-]{11})\]\.\w+$', path)
+    if match:
+        return match.group(1)
+    if not ffmpeg_path:
+        return None
+    try:
+        # FFmpeg prints the input's metadata, then complains that no output was given
+        result = subprocess.run([ffmpeg_path, '-hide_banner', '-i', path],
+                                capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r'comment\s*:\s*\S*(?:[?&]v=|youtu\.be/)([\w-]{11})', result.stderr)
+    return match.group(1) if match else None
+
+def rebuild_archive(output_dir):
+    """Rebuild the archive from the MP4 files in output_dir. Returns the number of entries."""
+    ffmpeg_path = find_ffmpeg()
+    video_ids = []
+    for name in sorted(os.listdir(output_dir)):
+        if not name.lower().endswith('.mp4') or re.search(r'\.f[\w-]+\.mp4$', name):
+            continue
+        video_id = read_video_id_from_file(ffmpeg_path, os.path.join(output_dir, name))
+        if video_id:
+            video_ids.append(video_id)
+        else:
+            print(f"⚠️  No video ID found in {name}")
+    path = get_archive_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for video_id in dict.fromkeys(video_ids):
+            f.write(f"youtube {video_id} {ARCHIVE_ANY_QUALITY} -\n")
+    with archive_lock:
+        os.replace(temp_path, path)
+        archive_state.update({'path': None, 'keys': set(), 'offset': 0})
+    return len(dict.fromkeys(video_ids))
+
+# --- Video records ---
+# A full yt-dlp info dict carries every format, thumbnail and subtitle track (often
+# hundreds of KB). Once a format is chosen, only a VideoRecord is kept: the fields the
+# display needs, the two chosen formats, and a trimmed info dict yt-dlp can still
+# download from without extracting the page again.
+DOWNLOAD_INFO_FIELDS = STABLE_INFO_FIELDS + ('display_id', 'original_url', 'webpage_url_basename',
+                                             'webpage_url_domain', 'channel', 'timestamp', 'live_status')
+
+class VideoRecord:
+    __slots__ = ('video_id', 'url', 'title', 'uploader', 'duration', 'view_count', 'upload_date',
+                 'video_format', 'audio_format', 'estimated_bytes', 'download_info')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+def compact_video_record(info, video_format=None):
+    """Build a VideoRecord from an info dict and the selected video format.
+
+    The returned record holds no reference to the info dict or its other formats, so
+    the caller can drop it right after selection.
+    """
+    audio_format = get_best_audio_format(info)
+    download_info = {key: info[key] for key in DOWNLOAD_INFO_FIELDS if info.get(key) is not None}
+    download_info['formats'] = [fmt for fmt in (video_format, audio_format) if fmt]
+    return VideoRecord(
+        video_id=info.get('id'),
+        url=info.get('webpage_url'),
+        title=info.get('title', 'video'),
+        uploader=info.get('uploader'),
+        duration=info.get('duration'),
+        view_count=info.get('view_count'),
+        upload_date=info.get('upload_date'),
+        video_format=video_format,
+        audio_format=audio_format,
+        estimated_bytes=estimate_total_size(video_format, audio_format, info.get('duration')),
+        download_info=download_info,
+    )
+
+def display_video_info(record):
     """Display video information"""
-    print(f"\n📹 Video Title: {info.get('title', 'Unknown')}")
-    print(f"👤 Channel: {info.get('uploader', 'Unknown')}")
+    print(f"\n📹 Video Title: {record.title or 'Unknown'}")
+    print(f"👤 Channel: {record.uploader or 'Unknown'}")
     
     # Format duration
-    duration = info.get('duration', 0)
+    duration = record.duration or 0
     if duration:
-        minutes = duration // 60
-        seconds = duration % 60
+        minutes = int(duration // 60)
+        seconds = int(duration % 60)
         print(f"⏱️  Duration: {minutes}:{seconds:02d}")
     
-    print(f"👁️  Views: {info.get('view_count', 'Unknown'):,}" if info.get('view_count') else "👁️  Views: Unknown")
-    print(f"📅 Upload Date: {info.get('upload_date', 'Unknown')}")
+    print(f"👁️  Views: {record.view_count:,}" if record.view_count else "👁️  Views: Unknown")
+    print(f"📅 Upload Date: {record.upload_date or 'Unknown'}")
     print("-" * 60)
 
-def get_best_video_format(info, preferred_quality="1080p"):
-    """Get the best available video format up to preferred quality"""
-    formats = []
+# --- Format selection ---
+# Formats are scored by estimated download size (video plus the audio it will be merged
+# with), so at the same height and frame rate the smaller stream wins and a byte or time
+# budget can rule out streams that are too big. Sizes come from filesize, then
+# filesize_approx, then the bitrate times the duration.
+QUALITY_HEIGHTS = {
+    "4k": 2160,
+    "2k": 1440,
+    "1080p": 1080,
+    "720p": 720
+}
+MAX_FPS = 60
+CODEC_FAMILIES = {'h264': ('avc1', 'h264'), 'vp9': ('vp09', 'vp9'), 'av1': ('av01',)}
+
+selection_state = {
+    'max_bytes': None,      # per video
+    'max_seconds': None,    # per video, at the current bandwidth
+    'codec': None,          # preferred codec family at equal height and frame rate
+    'batch_bytes': None,    # shared by every video in the process
+    'batch_spent': 0,
+    'fetch_workers': 1,     # concurrent fetches the bandwidth limit is expected to be split over
+}
+selection_lock = threading.Lock()
+
+def estimate_format_size(fmt, duration=None):
+    """Estimated size of one format in bytes, or None if nothing to go on"""
+    if not fmt:
+        return None
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    bitrate = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if bitrate and duration:
+        return int(bitrate * 1000 / 8 * duration)  # tbr is in kbit/s
+    return None
+
+def estimate_total_size(video_format, audio_format, duration=None):
+    """Estimated bytes fetched for a video + audio pair, or None if the video size is unknown"""
+    video_size = estimate_format_size(video_format, duration)
+    if video_size is None:
+        return None
+    return video_size + (estimate_format_size(audio_format, duration) or 0)
+
+def codec_family(vcodec):
+    vcodec = (vcodec or '').lower()
+    for family, prefixes in CODEC_FAMILIES.items():
+        if vcodec.startswith(prefixes):
+            return family
+    return None
+
+def get_best_video_format(info, preferred_quality="1080p", budget=None):
+    """Get the best video-only format up to preferred quality that fits the budget.
+
+    budget may set 'max_bytes' (video plus paired audio) and 'codec' (a CODEC_FAMILIES
+    key). Highest resolution, then frame rate, wins; ties go to the preferred codec,
+    then the smallest estimated size. Returns the format dict from info itself.
+    """
+    budget = budget or {}
     if 'formats' not in info:
         print("❌ No formats available for this video.")
         return None
-    for fmt in info['formats']:
-        if (fmt.get('vcodec') != 'none' and 
-            fmt.get('acodec') == 'none' and 
-            fmt.get('height') is not None):
-            format_info = {
-                'format_id': fmt.get('format_id', 'Unknown'),
-                'ext': fmt.get('ext', 'Unknown'),
-                'filesize': fmt.get('filesize'),
-                'format_note': fmt.get('format_note', ''),
-                'height': fmt.get('height'),
-                'width': fmt.get('width'),
-                'fps': fmt.get('fps'),
-                'vcodec': fmt.get('vcodec'),
-                'format': fmt
-            }
-            formats.append(format_info)
+    formats = [fmt for fmt in info['formats']
+               if fmt.get('vcodec') != 'none' and fmt.get('acodec') == 'none'
+               and fmt.get('height') is not None]
     if not formats:
         print("❌ No video-only formats found for this video.")
         return None
-    formats.sort(key=lambda x: (-(x['height'] or 0), -(x['fps'] or 0)))
-    quality_map = {
-        "4k": 2160,
-        "2k": 1440,
-        "1080p": 1080,
-        "720p": 720
-    }
-    target_height = quality_map.get(preferred_quality, 1080)
-    target_fps = 60
-    for fmt in formats:
-        height = fmt['height'] or 0
-        fps = fmt['fps'] or 0
-        if height <= target_height and fps <= target_fps:
-            return fmt
-    return formats[0]
-
-def display_selected_format(format_info):
-    """Display the selected video format"""
+    target_height = QUALITY_HEIGHTS.get(preferred_quality, 1080)
+    candidates = [fmt for fmt in formats
+                  if fmt['height'] <= target_height and (fmt.get('fps') or 0) <= MAX_FPS]
+    if not candidates:
+        # Nothing at or below the preferred quality: fall back to the highest resolution
+        highest = max(fmt['height'] for fmt in formats)
+        candidates = [fmt for fmt in formats if fmt['height'] == highest]
+    audio_format = get_best_audio_format(info)
+    duration = info.get('duration')
+    sizes = {id(fmt): estimate_total_size(fmt, audio_format, duration) for fmt in candidates}
+    max_bytes = budget.get('max_bytes')
+    if max_bytes:
+        candidates = [fmt for fmt in candidates
+                      if sizes[id(fmt)] is not None and sizes[id(fmt)] <= max_bytes]
+        if not candidates:
+            print(f"❌ No format fits the size budget of {format_bytes(max_bytes)}.")
+            return None
+    codec = budget.get('codec')
+
+    def score(fmt):
+        size = sizes[id(fmt)]
+        return (fmt['height'], fmt.get('fps') or 0, bool(codec) and codec_family(fmt.get('vcodec')) == codec,
+                -(size if size is not None else float('inf')))
+
+    return max(candidates, key=score)
+
+def get_download_rate(priority=1):
+    """Bytes/s the next download can expect.
+
+    Under a bandwidth limit this is the job's fair share: the limit is split by priority
+    between the fetches already running, this job, and the fetch workers still idle
+    (counted at priority 1, since they will pick up jobs too). Without a limit it is the
+    best throughput a single fetch has measured, which already reflects the sharing.
+    """
+    with bandwidth_cond:
+        rate = bandwidth_state['rate']
+        active = list(bandwidth_state['active'].values())
+    if rate:
+        idle = max(0, selection_state['fetch_workers'] - len(active) - 1)
+        return rate * priority / (priority + sum(active) + idle)
+    with autotune_lock:
+        measured = list(autotune_state['throughput'].values()) + [autotune_state['http_throughput']]
+    measured = [rate for rate in measured if rate]
+    return max(measured) if measured else None
+
+def current_budget(priority=1):
+    """The byte budget and codec preference for the next video, from selection_state"""
+    limits = []
+    if selection_state['max_bytes']:
+        limits.append(selection_state['max_bytes'])
+    if selection_state['max_seconds']:
+        rate = get_download_rate(priority)
+        if rate:  # without a limit or a measurement there is nothing to convert with
+            limits.append(int(selection_state['max_seconds'] * rate))
+    if selection_state['batch_bytes']:
+        limits.append(max(0, selection_state['batch_bytes'] - selection_state['batch_spent']) or 1)
+    return {'max_bytes': min(limits) if limits else None, 'codec': selection_state['codec']}
+
+def select_video_format(info, preferred_quality="1080p", priority=1):
+    """Select a format under the configured budgets and charge its estimated size to the
+    batch budget; release_budget gives the bytes back if the download doesn't happen."""
+    with selection_lock:
+        fmt = get_best_video_format(info, preferred_quality, current_budget(priority))
+        size = estimate_total_size(fmt, get_best_audio_format(info), info.get('duration')) if fmt else None
+        if size and selection_state['batch_bytes']:
+            selection_state['batch_spent'] += size
+    return fmt
+
+def release_budget(nbytes):
+    if not nbytes:
+        return
+    with selection_lock:
+        selection_state['batch_spent'] = max(0, selection_state['batch_spent'] - nbytes)
+
+def display_selected_format(format_info, total_bytes=None):
+    """Display the selected video format and the estimated download size with audio"""
     print(f"\n📋 Selected Quality:")
     print(f"   Resolution: {format_info['height']}p")
-    print(f"   FPS: {format_info['fps'] or 'Unknown'}")
-    print(f"   Size: {format_info['filesize'] / (1024*1024):.1f} MB" if format_info['filesize'] else "   Size: Unknown")
+    print(f"   FPS: {format_info.get('fps') or 'Unknown'}")
+    print(f"   Size: ~{total_bytes / (1024*1024):.1f} MB with audio" if total_bytes else "   Size: Unknown")
     print("💡 Audio will be automatically downloaded and merged with your selected video quality.")
 
-def download_video_with_audio(url, format_id, output_path, filename):
-    """Download video with automatic audio merge"""
-    try:
+def run_ydl_download(ydl_opts, url, info=None):
+    """Run a yt-dlp download and return the processed info dict. When the info dict from
+    get_video_info is given it is processed directly, so the page, player JS and format
+    manifest are not fetched again."""
+    import yt_dlp
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        if info is None or not info_has_stream_urls(info):
+            result = ydl.extract_info(url, download=True)
+            refresh_cached_info(url, result)
+            return result
+        # Same path as yt-dlp's --load-info-json: strip resolved/private keys and re-run format selection
+        return ydl.process_ie_result(ydl.sanitize_info(info, remove_private_keys=True), download=True)
+
+# FFmpeg arguments for the video + audio merge
+MERGE_VIDEO_ARGS = ['-c:v', 'copy']  # Copy video stream without re-encoding
+COPY_AUDIO_ARGS = ['-c:a', 'copy']
+
+def get_aac_audio_args(encoder='aac'):
+    return [
+        '-c:a', encoder,  # Convert audio to AAC
+        '-b:a', '192k',   # Audio bitrate
+        '-ar', '44100',   # Audio sample rate
+    ]
+
+def get_best_audio_format(info):
+    """Return the audio-only format the merge will use: best m4a, then aac, then any audio.
+
+    yt-dlp orders formats worst to best, so the last match is the best one.
+    """
+    audio_formats = [fmt for fmt in info.get('formats') or []
+                     if fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')]
+    for preferred_ext in ('m4a', 'aac', None):
+        candidates = [fmt for fmt in audio_formats
+                      if preferred_ext is None or fmt.get('ext') == preferred_ext]
+        if candidates:
+            return candidates[-1]
+    return None
+
+def is_aac_audio(audio_format):
+    """True if the audio stream can be copied into MP4 without re-encoding"""
+    acodec = (audio_format.get('acodec') or '').lower()
+    return acodec.startswith('mp4a') or acodec == 'aac'
+
+def get_audio_merge_args(audio_format, encoder='aac'):
+    """Stream-copy AAC audio, transcode anything else (or unknown) to AAC"""
+    if audio_format and is_aac_audio(audio_format):
+        return COPY_AUDIO_ARGS
+    return get_aac_audio_args(encoder)
+
+def new_cancel_hook(cancel_event):
+    """Progress hook that aborts the yt-dlp download once cancel_event is set"""
+    def on_progress(d):
+        if cancel_event is not None and cancel_event.is_set():
+            raise Exception("Download cancelled")
+
+    return on_progress
+
+def new_stage_tracker():
+    """Track which stage a yt-dlp fetch is in so failures can be classified.
+
+    Returns the shared state dict plus a progress hook and a postprocessor hook.
+    """
+    state = {'stage': 'network', 'fetched': []}
+
+    def on_progress(d):
+        if d['status'] == 'downloading':
+            state['stage'] = 'network'
+        elif d['status'] == 'finished' and d.get('filename'):
+            if d['filename'] not in state['fetched']:
+                state['fetched'].append(d['filename'])
+
+    def on_postprocess(d):
+        if d['status'] == 'started':
+            state['stage'] = 'postprocess'
+        elif d['status'] == 'finished':
+            state['stage'] = 'done'
+
+    return state, on_progress, on_postprocess
+
+def fetch_streams(url, format_id, output_path, filename, info=None, quiet=False, priority=1,
+                  cancel_event=None):
+    """Fetch stage: download the video and audio streams as separate files, without merging.
+
+    The streams go to the staging directory. Returns a merge task dict for merge_streams
+    (whose output_file is in output_path), or None if the fetch failed. Network
+    failures are retried and resume from the .part files. priority weights this job's
+    share of the global bandwidth limit; setting cancel_event aborts the download.
+    """
+    if not quiet:
         print(f"\n🚀 Starting download: {filename}")
-        print("📹 Downloading video and audio, then merging...")
-        
-        # Create output directory if it doesn't exist
-        os.makedirs(output_path, exist_ok=True)
-        
-        # Get FFmpeg path
-        ffmpeg_path = get_ffmpeg_path()
-        if not ffmpeg_path:
-            print("❌ FFmpeg is required but could not be installed. Please install FFmpeg manually.")
-            return
-        
-        # Configure yt-dlp options for video + audio merge with AAC audio
-        ydl_opts = {
-            'format': f'{format_id}+bestaudio[ext=m4a]/bestaudio[ext=aac]/bestaudio/best',  # Video + best AAC audio
-            'outtmpl': os.path.join(output_path, filename),
-            'progress_hooks': [progress_hook],
-            'merge_output_format': 'mp4',  # Force MP4 output
-            'ffmpeg_location': ffmpeg_path,  # Use our FFmpeg
-            # Force audio codec to AAC for better compatibility
-            'postprocessor_args': [
-                '-c:v', 'copy',  # Copy video stream without re-encoding
-                '-c:a', 'aac',   # Convert audio to AAC
-                '-b:a', '192k',  # Audio bitrate
-                '-ar', '44100',  # Audio sample rate
-            ],
-        }
-        
-        # Download the video with audio
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        
-        print("\n✅ Download completed successfully!")
-        print(f"📁 File saved to: {os.path.join(output_path, filename)}")
-        print("🔊 Audio converted to AAC format for better compatibility")
-        
-    except Exception as e:
-        print(f"\n❌ Download failed: {str(e)}")
-        # Try fallback method without audio conversion
-        print("🔄 Trying fallback method...")
+        print("📹 Downloading video and audio...")
+    
+    # Create output directory if it doesn't exist
+    os.makedirs(output_path, exist_ok=True)
+    staging_path = get_staging_dir(output_path)
+    os.makedirs(staging_path, exist_ok=True)
+    
+    output_file = os.path.join(output_path, filename)
+    video_id = (info or {}).get('id') or extract_video_id(url or '')
+    # The video ID keeps intermediates apart when two videos share a title
+    base_name = os.path.splitext(filename)[0] + (f' [{video_id}]' if video_id else '')
+    state, on_progress, on_postprocess = new_stage_tracker()
+    on_measure, measured_throughput, measured_files = new_throughput_meter()
+    audio_format = get_best_audio_format(info) if info else None
+    audio_spec = 'bestaudio[ext=m4a]/bestaudio[ext=aac]/bestaudio'  # Best AAC audio
+    if audio_format:
+        # Pin the audio format the merge arguments are chosen for
+        audio_spec = f"{audio_format['format_id']}/{audio_spec}"
+    # Configure yt-dlp to fetch video and audio as separate files (',' means no merge);
+    # the names match yt-dlp's own intermediate .fNNN files so earlier partials are reused
+    ydl_opts = {
+        'format': f'{format_id},{audio_spec}',
+        'outtmpl': os.path.join(staging_path, base_name.replace('%', '%%') + '.f%(format_id)s.%(ext)s'),
+        'progress_hooks': [on_progress, new_progress_hook(output_file, filename),
+                           new_bandwidth_hook(output_file, priority), on_measure,
+                           new_cancel_hook(cancel_event)],
+        'postprocessor_hooks': [on_postprocess],
+        'continuedl': True,  # Resume from .part files on retry
+        # Progress is drawn by the shared renderer, not by yt-dlp
+        'quiet': True,
+        'noprogress': True,
+    }
+    config = load_config()
+    retries = config.get('download_retries', 2)
+    autotune = autotune_state['enabled'] or config.get('fragment_autotune', False)
+    host = get_format_host(info, format_id)
+    fragmented = is_fragmented_format(info, format_id)
+    register_bandwidth_job(output_file, priority)
+    
+    for attempt in range(retries + 1):
+        if autotune:
+            ydl_opts.update(get_fragment_settings(fragmented))
+        try:
+            # Only fragmented formats open parallel connections; a progressive one uses one
+            connections = ydl_opts.get('concurrent_fragment_downloads', 1) if fragmented else 1
+            with host_connection(host, connections) as granted:
+                if fragmented and 'concurrent_fragment_downloads' in ydl_opts:
+                    ydl_opts['concurrent_fragment_downloads'] = granted
+                result = run_ydl_download(ydl_opts, url, info)
+            if autotune:
+                report_fetch_throughput(ydl_opts.get('concurrent_fragment_downloads'), measured_throughput())
+            downloads = (result or {}).get('requested_downloads') or []
+            fetched = [d['filepath'] for d in downloads if d.get('filepath')] or state['fetched']
+            break
+        except Exception as e:
+            if cancel_event is not None and cancel_event.is_set():
+                print(f"⏹️  Download cancelled: {filename}")
+                break
+            if autotune and state['stage'] == 'network':
+                report_fetch_throughput(ydl_opts.get('concurrent_fragment_downloads'), None, failed=True)
+            print(f"\n❌ Download failed during {state['stage']} stage: {str(e)}")
+            if state['stage'] in ('postprocess', 'done'):
+                # Only a per-file fixup failed; the streams themselves are on disk
+                fetched = state['fetched']
+                break
+            if attempt < retries:
+                inc_counter('ytdl_retries_total', {'stage': 'fetch'})
+                print(f"🔄 Resuming from partial files (retry {attempt + 1}/{retries})...")
+    else:
+        forget_bandwidth_job(output_file)
+        finish_progress(output_file)
+        return None
+    forget_bandwidth_job(output_file)
+    finish_progress(output_file)
+    if cancel_event is not None and cancel_event.is_set():
+        return None
+    
+    fetched = [f for f in fetched if os.path.exists(f)]
+    if not fetched:
+        print("❌ No downloaded streams found to merge.")
+        return None
+    metrics = {'format_id': format_id, 'fetch_retries': attempt}
+    for path, stats in measured_files.items():
+        stream = 'video' if f'.f{format_id}.' in os.path.basename(path or '') else 'audio'
+        transferred = stats.get('bytes', 0) - stats['start_bytes']
+        metrics[f'fetch_{stream}_seconds'] = stats.get('elapsed', 0)
+        metrics[f'{stream}_bytes'] = transferred
+        observe_phase(f'fetch_{stream}', stats.get('elapsed', 0))
+        inc_counter('ytdl_downloaded_bytes_total', {'stream': stream}, transferred)
+    return {
+        'metrics': metrics,
+        'fetched': fetched,
+        'output_file': output_file,
+        'audio_format': audio_format,
+        'video_id': video_id,
+        'format_id': format_id,
+    }
+
+def merge_streams(task, quiet=False):
+    """Merge stage: mux the fetched streams into the final MP4 with FFmpeg.
+
+    AAC audio is stream-copied, anything else is transcoded. If that fails the merge
+    is retried with the other audio setting, never by downloading again.
+    """
+    ffmpeg_path = get_ffmpeg_path()
+    if not ffmpeg_path:
+        print("❌ FFmpeg is required but could not be installed. Please install FFmpeg manually.")
+        return False
+    audio_format = task['audio_format']
+    encoder = pick_aac_encoder(ffmpeg_path)
+    audio_args = get_audio_merge_args(audio_format, encoder)
+    if not quiet:
+        if audio_args != COPY_AUDIO_ARGS:
+            print(f"🔧 Merging video and audio (converting audio to AAC with {encoder})...")
+        else:
+            print(f"🔧 Merging video and audio (audio already AAC: {audio_format.get('acodec')}, copying)...")
+    retry_args = COPY_AUDIO_ARGS if audio_args != COPY_AUDIO_ARGS else get_aac_audio_args(encoder)
+    video_id = task.get('video_id')
+    metrics = task.setdefault('metrics', {})
+    started = time.monotonic()
+    merged = merge_fetched_files(ffmpeg_path, task['fetched'], task['output_file'], audio_args, video_id)
+    if not merged:
+        print("🔄 Retrying merge with alternate audio settings...")
+        inc_counter('ytdl_retries_total', {'stage': 'merge'})
+        metrics['merge_retries'] = 1
+        audio_args = retry_args
+        merged = merge_fetched_files(ffmpeg_path, task['fetched'], task['output_file'], audio_args, video_id)
+    # 'copy' or the AAC encoder, so quiet (batch/service) merges still record the path taken
+    metrics['audio_merge'] = 'copy' if audio_args == COPY_AUDIO_ARGS else encoder
+    inc_counter('ytdl_merges_total', {'audio': metrics['audio_merge']})
+    metrics['merge_seconds'] = time.monotonic() - started
+    observe_phase('merge', metrics['merge_seconds'])
+    if not merged:
+        print("❌ Merge failed. The downloaded streams were kept for inspection.")
+    return merged
+
+def merge_fetched_files(ffmpeg_path, input_files, output_file, audio_args, video_id=None):
+    """Merge already-downloaded streams with FFmpeg directly, without re-fetching them.
+
+    The merge runs next to the input files (the staging directory) and the result is
+    then moved to output_file.
+    """
+    temp_output = os.path.join(os.path.dirname(input_files[0]), os.path.basename(output_file) + '.merge.mp4')
+    cmd = [ffmpeg_path, '-y', '-loglevel', 'error']
+    for input_file in input_files:
+        cmd += ['-i', input_file]
+    if len(input_files) > 1:
+        cmd += ['-map', '0:v:0', '-map', '1:a:0']
+    cmd += MERGE_VIDEO_ARGS + audio_args
+    if video_id:
+        # Lets the download archive be rebuilt from the output files later
+        cmd += ['-metadata', f'comment=https://www.youtube.com/watch?v={video_id}']
+    cmd += ['-movflags', '+faststart', temp_output]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except OSError as e:
+        print(f"❌ Could not run FFmpeg: {str(e)}")
+        return False
+    if result.returncode != 0:
+        print(f"❌ FFmpeg merge failed: {result.stderr.strip()[-300:]}")
+        if os.path.exists(temp_output):
+            os.unlink(temp_output)
+        return False
+    try:
+        move_into_place(temp_output, output_file)
+    except OSError as e:
+        print(f"❌ Could not move the merged file to {output_file}: {str(e)}")
+        if os.path.exists(temp_output):
+            os.unlink(temp_output)
+        return False
+    for input_file in input_files:
         try:
-            fallback_ydl_opts = {
-                'format': f'{format_id}+bestaudio/best',  # Simple format selection
-                'outtmpl': os.path.join(output_path, filename),
-                'progress_hooks': [progress_hook],
-                'merge_output_format': 'mp4',
-                'ffmpeg_location': ffmpeg_path,
+            os.unlink(input_file)
+        except OSError:
+            pass
+    return True
+
+def download_video_with_audio(url, format_id, output_path, filename, info=None, quality=None,
+                              estimated_bytes=None):
+    """Download video with automatic audio merge. Returns True on success.
+
+    Pass the already-extracted info dict to skip a second extraction of the URL, the
+    quality setting to record the download in the archive, and the estimated size to
+    refuse up front when the disk can't hold it.
+    """
+    # Get FFmpeg path
+    if not get_ffmpeg_path():
+        print("❌ FFmpeg is required but could not be installed. Please install FFmpeg manually.")
+        return False
+    reservation = reserve_space(estimated_bytes, output_path, wait=False)
+    if reservation is None:
+        return False
+    try:
+        with progress_display():
+            task = fetch_streams(url, format_id, output_path, filename, info)
+        if not task or not merge_streams(task):
+            return False
+    finally:
+        release_space(reservation)
+    if quality:
+        record_archive(task['video_id'], quality, format_id)
+    print("\n✅ Download completed successfully!")
+    print(f"📁 File saved to: {task['output_file']}")
+    return True
+
+# --- Progress reporting ---
+# yt-dlp progress hooks can fire thousands of times per second, so they only update the
+# shared per-job counters below. A single renderer thread draws them at a fixed rate: a
+# redrawn multi-job view on a terminal, or one JSON line per interval otherwise.
+PROGRESS_TTY_INTERVAL = 0.5
+PROGRESS_PIPE_INTERVAL = 5.0
+
+progress_jobs = {}
+progress_lock = threading.Lock()
+progress_renderer = {'thread': None, 'stop': None, 'output': None, 'users': 0}
+
+def new_progress_hook(job_key, label):
+    """Progress hook that records a job's bytes, speed and ETA without any terminal I/O"""
+    files = {}
+
+    def on_progress(d):
+        if d['status'] not in ('downloading', 'finished'):
+            return
+        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        files[d.get('filename')] = (d.get('downloaded_bytes') or total, total)
+        downloaded = sum(f[0] for f in files.values())
+        total_bytes = sum(f[1] for f in files.values())
+        downloading = d['status'] == 'downloading'
+        with progress_lock:
+            progress_jobs[job_key] = {
+                'label': label,
+                'downloaded_bytes': downloaded,
+                'total_bytes': total_bytes,
+                'speed': (d.get('speed') or 0) if downloading else 0,
+                'eta': (d.get('eta') or 0) if downloading else 0,
             }
-            
-            with yt_dlp.YoutubeDL(fallback_ydl_opts) as ydl:
-                ydl.download([url])
-            
-            print("\n✅ Download completed with fallback method!")
-            print(f"📁 File saved to: {os.path.join(output_path, filename)}")
-            
-        except Exception as fallback_error:
-            print(f"\n❌ Fallback method also failed: {str(fallback_error)}")
-
-def progress_hook(d):
-    """Progress hook for download tracking"""
-    if d['status'] == 'downloading':
-        if 'total_bytes' in d and d['total_bytes']:
-            percent = (d['downloaded_bytes'] / d['total_bytes']) * 100
-            print(f"\r📊 Progress: {percent:.1f}%", end='', flush=True)
-    elif d['status'] == 'finished':
-        print("\n✅ Download finished!")
-    elif d['status'] == 'postprocess':
-        print("\n🔧 Merging video and audio...")
+
+    return on_progress
+
+def finish_progress(job_key):
+    with progress_lock:
+        progress_jobs.pop(job_key, None)
+
+def format_bytes(num):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(num) < 1024:
+            return f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} TB"
+
+def progress_snapshot():
+    with progress_lock:
+        jobs = [dict(job) for job in progress_jobs.values()]
+    totals = {
+        'active': len(jobs),
+        'downloaded_bytes': sum(job['downloaded_bytes'] for job in jobs),
+        'total_bytes': sum(job['total_bytes'] for job in jobs),
+        'speed': sum(job['speed'] for job in jobs),
+    }
+    return jobs, totals
+
+def render_progress_lines(jobs, totals):
+    lines = []
+    for job in jobs:
+        percent = f"{job['downloaded_bytes'] / job['total_bytes'] * 100:5.1f}%" if job['total_bytes'] else "  ?  "
+        eta = f"{int(job['eta']) // 60}:{int(job['eta']) % 60:02d}" if job['eta'] else "--:--"
+        lines.append(f"📥 {job['label'][:40]:<40} {percent} {format_bytes(job['speed']):>10}/s  ETA {eta}")
+    lines.append(f"📊 {totals['active']} active, {format_bytes(totals['speed'])}/s, "
+                 f"{format_bytes(totals['downloaded_bytes'])} / {format_bytes(totals['total_bytes'])}")
+    return lines
+
+class RendererOutput:
+    """Stands in for sys.stdout while the terminal view is drawn.
+
+    Messages printed by the workers are held here and written out by the renderer above
+    its frame, so the next redraw (which clears the previous frame) doesn't erase them.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        with self.lock:
+            self.pending.append(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def take(self, partial=False):
+        """Complete lines written so far (and with partial, any unfinished last line)"""
+        with self.lock:
+            text = "".join(self.pending)
+            end = len(text) if partial else text.rfind("\n") + 1
+            self.pending = [text[end:]] if text[end:] else []
+        return text[:end]
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def run_progress_renderer(stop, interval, is_tty, output=None):
+    drawn = 0
+    while not stop.wait(interval):
+        jobs, totals = progress_snapshot()
+        messages = output.take() if output else ""
+        if not jobs and not drawn and not messages:
+            continue
+        if is_tty:
+            lines = render_progress_lines(jobs, totals)
+            # Move back over the previous frame, clear everything below it, print the
+            # messages since then and draw the new frame under them
+            frame = (f"\x1b[{drawn}F" if drawn else "") + "\x1b[J" + messages + "\n".join(lines) + "\n"
+            output.stream.write(frame)
+            output.stream.flush()
+            drawn = len(lines)
+        elif jobs:
+            sys.stdout.write(json.dumps({'event': 'progress', 'time': time.time(),
+                                         'jobs': jobs, 'total': totals}) + "\n")
+            sys.stdout.flush()
+
+@contextlib.contextmanager
+def progress_display():
+    """Run the shared progress renderer for the duration of the block.
+
+    On a terminal, sys.stdout is routed through the renderer meanwhile (see RendererOutput).
+    """
+    with progress_lock:
+        progress_renderer['users'] += 1
+        if progress_renderer['users'] == 1:
+            is_tty = sys.stdout.isatty()
+            output = RendererOutput(sys.stdout) if is_tty else None
+            stop = threading.Event()
+            interval = PROGRESS_TTY_INTERVAL if is_tty else PROGRESS_PIPE_INTERVAL
+            thread = threading.Thread(target=run_progress_renderer, args=(stop, interval, is_tty, output),
+                                      daemon=True)
+            progress_renderer.update({'thread': thread, 'stop': stop, 'output': output})
+            if output:
+                sys.stdout = output
+            thread.start()
+    try:
+        yield
+    finally:
+        with progress_lock:
+            progress_renderer['users'] -= 1
+            last = progress_renderer['users'] == 0
+        if last:
+            progress_renderer['stop'].set()
+            progress_renderer['thread'].join()
+            output = progress_renderer['output']
+            if output:
+                sys.stdout = output.stream
+                sys.stdout.write(output.take(partial=True))
+                sys.stdout.flush()
 
 def format_filename(title):
     """Format filename by removing invalid characters"""
@@ -391,7 +1455,26 @@ def load_config():
         except Exception:
             pass
     # Default config
-    return {"quality": "1080p"}
+    return {
+        "quality": "1080p",
+        "batch_workers": 3,
+        "merge_workers": 2,
+        "download_retries": 2,
+        "bandwidth_limit_mbps": 0,
+        "max_connections_per_host": 4,
+        "fragment_autotune": False,
+        "cache_enabled": True,
+        "archive_enabled": True,
+        "journal_enabled": True,
+        "cache_ttl_hours": 24,
+        "cache_max_entries": 5000,
+        "max_video_mb": 0,
+        "batch_budget_mb": 0,
+        "time_budget_seconds": 0,
+        "preferred_codec": None,
+        "staging_dir": None,
+        "min_free_mb": 512,
+    }
 
 def save_config(config):
     config_dir = get_userdata_config_dir()
@@ -436,15 +1519,1487 @@ def settings_menu():
         else:
             print("❌ Invalid option.")
 
+# --- Metrics ---
+# Aggregates (counters and per-phase duration histograms) are kept in memory and can be
+# scraped in Prometheus text format from --metrics-port. With --metrics-jsonl, one JSON
+# record per finished batch job is appended to a file.
+PHASE_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+metrics_state = {'counters': {}, 'histograms': {}, 'jsonl_path': None}
+metrics_lock = threading.Lock()
+# Per-thread outcome of the last metadata cache lookup ('hit', 'stale_urls', 'miss')
+cache_events = threading.local()
+
+def inc_counter(name, labels=None, value=1):
+    key = (name, tuple(sorted((labels or {}).items())))
+    with metrics_lock:
+        metrics_state['counters'][key] = metrics_state['counters'].get(key, 0) + value
+
+def observe_phase(phase, seconds):
+    """Record a phase duration in its histogram"""
+    with metrics_lock:
+        histogram = metrics_state['histograms'].setdefault(
+            phase, {'buckets': [0] * len(PHASE_BUCKETS), 'sum': 0.0, 'count': 0})
+        for index, bound in enumerate(PHASE_BUCKETS):
+            if seconds <= bound:
+                histogram['buckets'][index] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+def format_labels(labels):
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}' if labels else ''
+
+def render_metrics():
+    """Current aggregates in Prometheus text exposition format"""
+    lines = []
+    with metrics_lock:
+        counters = sorted(metrics_state['counters'].items())
+        histograms = {phase: dict(h, buckets=list(h['buckets']))
+                      for phase, h in sorted(metrics_state['histograms'].items())}
+    with cache_lock:
+        cache_counts = dict(cache_stats)
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            lines.append(f'# TYPE {name} counter')
+            seen.add(name)
+        lines.append(f'{name}{format_labels(labels)} {value}')
+    lines.append('# TYPE ytdl_cache_events_total counter')
+    for event, value in sorted(cache_counts.items()):
+        lines.append(f'ytdl_cache_events_total{{event="{event}"}} {value}')
+    lines.append('# TYPE ytdl_phase_seconds histogram')
+    for phase, histogram in histograms.items():
+        for bound, count in zip(PHASE_BUCKETS, histogram['buckets']):
+            lines.append(f'ytdl_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}')
+        lines.append(f'ytdl_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'ytdl_phase_seconds_sum{{phase="{phase}"}} {histogram["sum"]:.3f}')
+        lines.append(f'ytdl_phase_seconds_count{{phase="{phase}"}} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serve render_metrics() at http://host:port/metrics from a daemon thread"""
+    import http.server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render_metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def emit_job_record(job):
+    """Count a finished job and append its JSONL record if --metrics-jsonl is set"""
+    inc_counter('ytdl_jobs_total', {'status': job['status']})
+    path = metrics_state['jsonl_path']
+    if not path:
+        return
+    metrics = job.get('metrics', {})
+    phases = {phase: metrics[f'{phase}_seconds'] for phase in ('extract', 'fetch_video', 'fetch_audio', 'merge')
+              if metrics.get(f'{phase}_seconds') is not None}
+    total_bytes = metrics.get('video_bytes', 0) + metrics.get('audio_bytes', 0)
+    fetch_seconds = phases.get('fetch_video', 0) + phases.get('fetch_audio', 0)
+    record = {
+        'time': time.time(),
+        'url': job['url'],
+        'video_id': extract_video_id(job['url']),
+        'status': job['status'],
+        'error': job['error'],
+        'format_id': metrics.get('format_id'),
+        'audio_merge': metrics.get('audio_merge'),
+        'cache': metrics.get('cache'),
+        'bytes': total_bytes,
+        'phases': phases,
+        'throughput_bps': total_bytes / fetch_seconds if fetch_seconds else None,
+        'retries': {'fetch': metrics.get('fetch_retries', 0), 'merge': metrics.get('merge_retries', 0)},
+    }
+    with metrics_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+# --- Bandwidth scheduling ---
+# One token bucket shared by every download in the process. Downloads are throttled from
+# their progress hooks: each reported chunk must be paid for with tokens before yt-dlp
+# reads the next one. Waiting chunks are granted in order of a per-job virtual finish time
+# (weighted fair queuing), so jobs share the rate evenly and a job with priority 2 gets
+# twice the share of a priority 1 job.
+bandwidth_state = {
+    'rate': 0,          # bytes per second, 0 = unlimited
+    'tokens': 0.0,
+    'updated': 0.0,
+    'vtime': 0.0,       # virtual time of the last granted chunk
+    'job_vtime': {},
+    'waiters': [],      # heap of (finish_tag, sequence)
+    'sequence': 0,
+    'active': {},       # job_key -> priority of each running fetch
+}
+bandwidth_cond = threading.Condition()
+host_slots = {}  # host -> connections in use
+host_slots_cond = threading.Condition()
+
+def set_bandwidth_limit(mbps):
+    """Set the process-wide download rate in megabits per second (0 or None = unlimited)"""
+    with bandwidth_cond:
+        bandwidth_state['rate'] = int((mbps or 0) * 1000 * 1000 / 8)
+        bandwidth_state['tokens'] = 0.0
+        bandwidth_state['updated'] = time.monotonic()
+        bandwidth_cond.notify_all()
+
+def throttle(job_key, nbytes, priority=1):
+    """Block until nbytes may be transferred under the shared bandwidth limit"""
+    with bandwidth_cond:
+        rate = bandwidth_state['rate']
+        if not rate or nbytes <= 0:
+            return
+        burst = max(rate, 1024 * 1024)  # at most one second (and at least 1MB) of burst
+        start_tag = max(bandwidth_state['job_vtime'].get(job_key, 0.0), bandwidth_state['vtime'])
+        finish_tag = start_tag + nbytes / max(priority, 0.01)
+        bandwidth_state['job_vtime'][job_key] = finish_tag
+        bandwidth_state['sequence'] += 1
+        ticket = (finish_tag, bandwidth_state['sequence'])
+        heapq.heappush(bandwidth_state['waiters'], ticket)
+        while True:
+            now = time.monotonic()
+            bandwidth_state['tokens'] = min(burst, bandwidth_state['tokens']
+                                            + (now - bandwidth_state['updated']) * bandwidth_state['rate'])
+            bandwidth_state['updated'] = now
+            needed = min(nbytes, burst)
+            if bandwidth_state['waiters'][0] == ticket:
+                if bandwidth_state['tokens'] >= needed or not bandwidth_state['rate']:
+                    # Chunks bigger than the burst drive the bucket negative and delay the next grant
+                    bandwidth_state['tokens'] -= nbytes
+                    heapq.heappop(bandwidth_state['waiters'])
+                    bandwidth_state['vtime'] = finish_tag
+                    bandwidth_cond.notify_all()
+                    return
+                bandwidth_cond.wait((needed - bandwidth_state['tokens']) / bandwidth_state['rate'])
+            else:
+                bandwidth_cond.wait()
+
+def register_bandwidth_job(job_key, priority=1):
+    with bandwidth_cond:
+        bandwidth_state['active'][job_key] = priority
+
+def forget_bandwidth_job(job_key):
+    with bandwidth_cond:
+        bandwidth_state['job_vtime'].pop(job_key, None)
+        bandwidth_state['active'].pop(job_key, None)
+
+def new_bandwidth_hook(job_key, priority=1):
+    """Progress hook that charges each newly downloaded chunk to the shared bucket"""
+    seen = {}
+
+    def on_progress(d):
+        if d['status'] != 'downloading':
+            return
+        filename = d.get('filename')
+        downloaded = d.get('downloaded_bytes') or 0
+        delta = downloaded - seen.get(filename, downloaded)
+        seen[filename] = downloaded
+        throttle(job_key, delta, priority)
+
+    return on_progress
+
+@contextlib.contextmanager
+def host_connection(host, connections=1):
+    """Hold connections of the config's max_connections_per_host slots for host.
+
+    A fragmented (DASH/HLS) fetch opens several connections at once, so it asks for that
+    many; any other fetch asks for one. A request is granted at most the whole limit and
+    yields the number of connections it may actually open.
+    """
+    limit = load_config().get('max_connections_per_host', 4)
+    if not limit or not host:
+        yield connections
+        return
+    granted = max(1, min(connections, limit))
+    with host_slots_cond:
+        while host_slots.get(host, 0) + granted > limit:
+            host_slots_cond.wait()
+        host_slots[host] = host_slots.get(host, 0) + granted
+    try:
+        yield granted
+    finally:
+        with host_slots_cond:
+            host_slots[host] -= granted
+            host_slots_cond.notify_all()
+
+def get_format_host(info, format_id):
+    """Host serving the given format, falling back to YouTube itself"""
+    for fmt in (info or {}).get('formats') or []:
+        if fmt.get('format_id') == format_id and fmt.get('url'):
+            return urlparse(fmt['url']).hostname
+    return 'www.youtube.com'
+
+# --- Fragment concurrency auto-tuning ---
+# DASH/HLS formats are fetched fragment by fragment. With auto-tuning on, each fetch
+# measures its throughput and the next fetch adjusts yt-dlp's concurrent_fragment_downloads:
+# double while throughput keeps improving by at least AUTOTUNE_MIN_GAIN, hold once gains
+# level off, and halve after errors or a throughput collapse (throttling). Concurrency never
+# exceeds max_connections_per_host, so a fetch always gets the connections it was tuned for.
+# Progressive (plain HTTPS) formats are a single stream: for those only the HTTP chunk
+# size is tuned, from their own throughput measurements.
+AUTOTUNE_MAX_CONCURRENCY = 16
+AUTOTUNE_MIN_GAIN = 0.10          # a step up must beat the previous level by 10%
+AUTOTUNE_THROTTLE_RATIO = 0.5     # below half the usual throughput counts as throttled
+AUTOTUNE_CHUNK_SECONDS = 4        # size HTTP chunks to about this many seconds per request
+MIN_HTTP_CHUNK_SIZE = 1024 * 1024
+MAX_HTTP_CHUNK_SIZE = 10 * 1024 * 1024  # YouTube throttles larger ranged requests
+FRAGMENTED_PROTOCOLS = ('http_dash_segments', 'm3u8')  # prefixes, e.g. m3u8_native
+
+autotune_state = {
+    'enabled': False,   # forced on by --autotune; otherwise the fragment_autotune config key
+    'concurrency': 1,
+    'plateau': False,
+    'throughput': {},   # concurrency -> smoothed bytes/s of fragmented fetches
+    'http_throughput': None,  # smoothed bytes/s of progressive fetches
+}
+autotune_lock = threading.Lock()
+
+def get_format_protocol(info, format_id):
+    """yt-dlp protocol of the given format, or None if the info doesn't list it"""
+    for fmt in (info or {}).get('formats') or []:
+        if fmt.get('format_id') == format_id:
+            return fmt.get('protocol')
+    return None
+
+def is_fragmented_format(info, format_id):
+    """Whether the format is fetched as DASH/HLS fragments rather than one HTTP stream"""
+    return (get_format_protocol(info, format_id) or '').startswith(FRAGMENTED_PROTOCOLS)
+
+def get_autotune_limit():
+    """Highest fragment concurrency the tuner may use: never more than one host allows"""
+    limit = load_config().get('max_connections_per_host', 4)
+    return min(AUTOTUNE_MAX_CONCURRENCY, limit) if limit else AUTOTUNE_MAX_CONCURRENCY
+
+def get_fragment_settings(fragmented=True):
+    """yt-dlp options for the next fetch under the current auto-tune state.
+
+    Fragmented formats get the tuned concurrent_fragment_downloads; progressive ones only
+    an http_chunk_size sized from the throughput progressive fetches have measured.
+    """
+    if fragmented:
+        limit = get_autotune_limit()
+        with autotune_lock:
+            autotune_state['concurrency'] = min(autotune_state['concurrency'], limit)
+            return {'concurrent_fragment_downloads': autotune_state['concurrency']}
+    with autotune_lock:
+        measured = autotune_state['http_throughput']
+    chunk_size = MAX_HTTP_CHUNK_SIZE
+    if measured:
+        chunk_size = int(min(MAX_HTTP_CHUNK_SIZE,
+                             max(MIN_HTTP_CHUNK_SIZE, measured * AUTOTUNE_CHUNK_SECONDS)))
+    return {'http_chunk_size': chunk_size}
+
+def report_fetch_throughput(concurrency, throughput, failed=False):
+    """Feed one fetch's result back into the tuner.
+
+    concurrency is the fragment concurrency the fetch ran with, or None for a progressive
+    fetch, whose throughput only sizes the HTTP chunks.
+    """
+    limit = get_autotune_limit()
+    with autotune_lock:
+        if concurrency is None:
+            previous = autotune_state['http_throughput']
+            if failed:
+                autotune_state['http_throughput'] = None  # fall back to the default chunk size
+            elif throughput:
+                autotune_state['http_throughput'] = (throughput if previous is None
+                                                     else 0.7 * previous + 0.3 * throughput)
+            return
+        samples = autotune_state['throughput']
+        previous = samples.get(concurrency)
+        if failed or (previous and throughput and throughput < previous * AUTOTUNE_THROTTLE_RATIO):
+            # Errors or a sudden collapse: back off and start probing upwards again later
+            autotune_state['concurrency'] = max(1, concurrency // 2)
+            autotune_state['plateau'] = False
+            samples.pop(concurrency, None)
+            return
+        if not throughput:
+            return
+        samples[concurrency] = throughput if previous is None else 0.7 * previous + 0.3 * throughput
+        if concurrency != autotune_state['concurrency']:
+            return  # a stale report from a fetch that started under older settings
+        lower = samples.get(concurrency // 2) if concurrency > 1 else None
+        if lower and samples[concurrency] < lower * (1 + AUTOTUNE_MIN_GAIN):
+            # The last step up didn't pay off: settle on the lower level
+            autotune_state['concurrency'] = concurrency // 2
+            autotune_state['plateau'] = True
+        elif not autotune_state['plateau'] and concurrency * 2 <= limit:
+            autotune_state['concurrency'] = concurrency * 2
+
+def new_throughput_meter():
+    """Progress hook measuring the bytes/s a fetch achieved, from downloaded_bytes and elapsed"""
+    files = {}
+
+    def on_progress(d):
+        if d['status'] not in ('downloading', 'finished') or d.get('elapsed') is None:
+            return
+        entry = files.setdefault(d.get('filename'), {'start_bytes': d.get('downloaded_bytes') or 0})
+        entry['bytes'] = d.get('downloaded_bytes') or d.get('total_bytes') or 0
+        entry['elapsed'] = d['elapsed']
+
+    def throughput():
+        transferred = sum(f.get('bytes', 0) - f['start_bytes'] for f in files.values())
+        elapsed = sum(f.get('elapsed', 0) for f in files.values())
+        return transferred / elapsed if elapsed > 0 and transferred > 0 else None
+
+    return on_progress, throughput, files
+
+# --- Disk space admission ---
+# Before a job starts fetching, the space it will need is reserved against the free space
+# of its volumes: the streams plus the merged file in the staging directory, and the final
+# file on the output volume if that is another filesystem. Reservations are released when
+# the job finishes. A job that doesn't fit waits for running jobs to release theirs, and
+# is rejected if it couldn't fit even on its own. Streams are fetched and merged in the
+# staging directory (default: the output directory) and the finished file is then moved
+# into place atomically, so nothing half-written ever appears in the output directory.
+DISK_HEADROOM = 1.05     # container overhead and size estimate error
+DISK_POLL_SECONDS = 5    # recheck free space this often while waiting
+
+disk_state = {
+    'staging_dir': None,  # from --staging-dir or the staging_dir config key
+    'reserved': {},       # st_dev -> bytes reserved by running jobs
+}
+disk_cond = threading.Condition()
+
+def get_staging_dir(output_dir):
+    return disk_state['staging_dir'] or output_dir
+
+def plan_space(nbytes, output_dir):
+    """Bytes a job of about nbytes needs per filesystem: {st_dev: [path, bytes]}"""
+    staging_dir = get_staging_dir(output_dir)
+    os.makedirs(staging_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    needed = int(nbytes * DISK_HEADROOM)
+    # The fetched streams and the merged file exist side by side until the merge finishes
+    needs = {os.stat(staging_dir).st_dev: [staging_dir, 2 * needed]}
+    needs.setdefault(os.stat(output_dir).st_dev, [output_dir, needed])
+    return needs
+
+def reserve_space(nbytes, output_dir, cancel_event=None, wait=True):
+    """Reserve disk space for a job of about nbytes.
+
+    Returns the reservation for release_space ({} when the size is unknown), or None if
+    the job was rejected or cancelled while waiting. With wait=False a job that doesn't
+    fit right now is rejected instead of queued.
+    """
+    if not nbytes:
+        return {}
+    needs = plan_space(nbytes, output_dir)
+    min_free = load_config().get('min_free_mb', 512) * 1024 * 1024
+    with disk_cond:
+        while True:
+            reserved = disk_state['reserved']
+            short = None
+            for dev, (path, amount) in needs.items():
+                free = shutil.disk_usage(path).free - reserved.get(dev, 0) - min_free
+                if amount > free:
+                    short = (dev, path, amount, free)
+                    break
+            if short is None:
+                for dev, (path, amount) in needs.items():
+                    reserved[dev] = reserved.get(dev, 0) + amount
+                return {dev: amount for dev, (path, amount) in needs.items()}
+            dev, path, amount, free = short
+            if not wait or not reserved.get(dev):
+                print(f"❌ Not enough disk space in {path}: need {format_bytes(amount)}, "
+                      f"{format_bytes(max(0, free))} available")
+                return None
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            disk_cond.wait(DISK_POLL_SECONDS)
+
+def release_space(reservation):
+    if not reservation:
+        return
+    with disk_cond:
+        for dev, amount in reservation.items():
+            disk_state['reserved'][dev] = max(0, disk_state['reserved'].get(dev, 0) - amount)
+        disk_cond.notify_all()
+
+def move_into_place(src, dest):
+    """Atomically move a finished file to dest, copying it over first if dest is on
+    another filesystem"""
+    try:
+        os.replace(src, dest)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # Hidden and without a media extension, so players and scanners skip the partial copy;
+    # list_temp_files knows the name, so journal recovery cleans it up too
+    temp = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.part")
+    try:
+        shutil.copyfile(src, temp)
+        with open(temp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temp, dest)
+    except OSError:
+        if os.path.exists(temp):
+            os.unlink(temp)
+        raise
+    os.unlink(src)
+
+# --- Job journal ---
+# Append-only log of batch job state changes, one JSON record per line, so a batch that
+# dies (crash, Ctrl+C, preempted machine) can be picked up again: finished jobs are
+# skipped, jobs whose streams were fully fetched go straight to the merge, and jobs that
+# were mid-download resume from their .part files. Like the archive, each record is one
+# O_APPEND write, and other processes' records are picked up by reading the new tail.
+JOURNAL_FINISHED = ('done', 'skipped', 'failed', 'cancelled')
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+JOURNAL_KEEP_SECONDS = 7 * 24 * 3600  # how long finished jobs are remembered
+JOURNAL_ORPHAN_SECONDS = 3600  # unowned partial files untouched this long are swept
+# Partial downloads, merge temporaries and cross-filesystem copies, whatever job they belonged to
+PARTIAL_FILE_PATTERN = re.compile(r'.+\.f[\w-]+\.\w+(\.part(-Frag\d+)?|\.ytdl)$|.+\.merge\.mp4$|\..+\.mp4\.part$')
+
+journal_state = {'path': None, 'entries': {}, 'offset': 0}
+journal_lock = threading.Lock()
+
+def get_journal_path():
+    return os.path.join(get_userdata_config_dir(), 'journal.jsonl')
+
+def journal_enabled():
+    return load_config().get('journal_enabled', True)
+
+def job_key(url, output_dir):
+    """Journal key: the same video saved to the same directory is the same job"""
+    return f"{extract_video_id(url) or url}@{os.path.abspath(output_dir)}"
+
+def refresh_journal():
+    """Fold records appended since the last refresh (by any process) into the latest state per job"""
+    path = get_journal_path()
+    if journal_state['path'] != path:
+        journal_state.update({'path': path, 'entries': {}, 'offset': 0})
+    try:
+        with open(path, 'rb') as f:
+            f.seek(journal_state['offset'])
+            data = f.read()
+    except OSError:
+        return
+    # A crash mid-append leaves a partial last line; it is ignored until completed
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].decode('utf-8', 'replace').splitlines():
+        try:
+            record = json.loads(line)
+            journal_state['entries'][record['key']] = record
+        except (ValueError, KeyError, TypeError):
+            continue
+    journal_state['offset'] += end
+
+def lookup_journal(url, output_dir):
+    """Latest journal record for this job, or None"""
+    with journal_lock:
+        refresh_journal()
+        return journal_state['entries'].get(job_key(url, output_dir))
+
+def journal_job(job, output_dir, task=None):
+    """Durably append the job's current state; task records the fetched streams for resuming"""
+    if not journal_enabled():
+        return
+    record = {
+        'key': job_key(job['url'], output_dir),
+        'time': time.time(),
+        'url': job['url'],
+        'priority': job['priority'],
+        'status': job['status'],
+        'output_dir': os.path.abspath(output_dir),
+        'title': job['title'],
+        'filename': job['filename'],
+        'error': job['error'],
+    }
+    if task:
+        audio_format = task['audio_format'] or {}
+        record['task'] = {
+            'fetched': task['fetched'],
+            'output_file': task['output_file'],
+            'audio_format': {k: audio_format.get(k) for k in ('format_id', 'acodec', 'ext')},
+            'video_id': task['video_id'],
+            'format_id': task['format_id'],
+            'quality': task.get('quality'),
+        }
+    line = (json.dumps(record) + '\n').encode('utf-8')
+    path = get_journal_path()
+    with journal_lock:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"⚠️  Could not update job journal: {str(e)}")
+
+def resumable_task(record):
+    """Rebuild the merge task of a job whose streams were all fetched, or None"""
+    task = record.get('task')
+    if record['status'] not in ('fetched', 'merging') or not task:
+        return None
+    if not task['fetched'] or not all(os.path.exists(path) for path in task['fetched']):
+        return None
+    return dict(task, metrics={'format_id': task['format_id'], 'resumed': True})
+
+def list_temp_files(output_dir, filename):
+    """yt-dlp intermediates, partial downloads and merge temporaries left for one output file"""
+    base = os.path.splitext(filename)[0]
+    pattern = re.compile(re.escape(base) + r'( \[[\w-]+\])?\.f[\w-]+\.\w+(\.part(-Frag\d+)?|\.ytdl)?$')
+    try:
+        names = os.listdir(output_dir)
+    except OSError:
+        return []
+    paths = [os.path.join(output_dir, name) for name in names if pattern.match(name)]
+    # The merge output, and the copy move_into_place makes across filesystems
+    for name in (f"{filename}.merge.mp4", f".{filename}.part"):
+        if name in names:
+            paths.append(os.path.join(output_dir, name))
+    return paths
+
+def record_temp_files(record):
+    """Temporaries of a journal record's job, in its output and staging directories"""
+    if not record.get('filename'):
+        return []
+    directories = {record['output_dir'], get_staging_dir(record['output_dir'])}
+    return [path for d in directories for path in list_temp_files(d, record['filename'])]
+
+def remove_files(paths):
+    """Delete the given files, returning how many were removed"""
+    removed = 0
+    for path in paths:
+        try:
+            os.unlink(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+def sweep_orphan_files(directories, owned):
+    """Delete partial files in directories that no journal record owns.
+
+    Recently modified files are left alone: they may belong to a job another process has
+    only just journaled.
+    """
+    cutoff = time.time() - JOURNAL_ORPHAN_SECONDS
+    orphans = []
+    for directory in directories:
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            path = os.path.join(directory, name)
+            if not PARTIAL_FILE_PATTERN.match(name) or path in owned:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    orphans.append(path)
+            except OSError:
+                pass
+    return remove_files(orphans)
+
+def recover_journal():
+    """Clean up after finished jobs and compact the journal. Returns the unfinished records.
+
+    Temporaries of done and cancelled jobs have no owner any more and are deleted; failed
+    jobs keep theirs so a rerun can resume or the streams can be inspected, until
+    compaction forgets the job. Partial files in the staging directories that no record
+    owns at all (e.g. from a journal that was deleted) are swept too, along with unowned
+    cross-filesystem copies in the output directories.
+    """
+    if not journal_enabled():
+        return []
+    with journal_lock:
+        refresh_journal()
+        records = list(journal_state['entries'].values())
+    removed = 0
+    owned = set()
+    for record in records:
+        if record['status'] in ('done', 'cancelled'):
+            removed += remove_files(record_temp_files(record))
+        else:
+            owned.update(record_temp_files(record))
+    directories = {d for record in records for d in (record['output_dir'], get_staging_dir(record['output_dir']))}
+    removed += sweep_orphan_files(directories, owned)
+    if removed:
+        print(f"🧹 Removed {removed} orphaned temporary file(s)")
+    try:
+        if os.path.getsize(get_journal_path()) > JOURNAL_COMPACT_BYTES:
+            compact_journal()
+    except OSError:
+        pass
+    return [record for record in records if record['status'] not in JOURNAL_FINISHED]
+
+def compact_journal():
+    """Rewrite the journal with only the latest record per job, dropping old finished jobs.
+
+    The temporaries of dropped jobs are deleted first, since nothing would own them after.
+    """
+    path = get_journal_path()
+    cutoff = time.time() - JOURNAL_KEEP_SECONDS
+    with journal_lock:
+        refresh_journal()
+        dropped = [record for record in journal_state['entries'].values()
+                   if record['status'] in JOURNAL_FINISHED and record['time'] < cutoff]
+        for record in dropped:
+            remove_files(record_temp_files(record))
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for record in journal_state['entries'].values():
+                if record['status'] not in JOURNAL_FINISHED or record['time'] >= cutoff:
+                    f.write(json.dumps(record) + '\n')
+            # Keep anything another process appended while this was being written
+            with open(path, 'rb') as src:
+                src.seek(journal_state['offset'])
+                f.write(src.read().decode('utf-8', 'replace'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        journal_state.update({'path': None, 'entries': {}, 'offset': 0})
+
+# --- Batch download queue ---
+MAX_BATCH_WORKERS = 16
+
+def parse_priority(value):
+    """Job priority from a batch file or API request: a positive number, 1 if not given.
+    Raises ValueError for anything else."""
+    if value is None:
+        return 1
+    if isinstance(value, bool):
+        raise ValueError("priority must be a number")
+    try:
+        priority = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("priority must be a number")
+    if not priority > 0 or priority == float('inf'):
+        raise ValueError("priority must be a positive number")
+    return priority
+
+def read_batch_urls(source):
+    """Read (url, priority) pairs from a file (or '-' for stdin).
+
+    One URL per line, optionally followed by a priority number (default 1) that weights
+    its share of the bandwidth limit; '#' starts a comment. An invalid priority is
+    reported with its line number and replaced by 1.
+    """
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    urls = []
+    for number, line in enumerate(lines, 1):
+        parts = line.split()
+        # '#' starts a comment, at the start of a line or after the URL
+        comment = next((i for i, part in enumerate(parts) if part.startswith('#')), len(parts))
+        parts = parts[:comment]
+        if not parts:
+            continue
+        try:
+            priority = parse_priority(parts[1] if len(parts) > 1 else None)
+        except ValueError as e:
+            print(f"⚠️  Line {number}: {str(e)} (got {parts[1]!r}); using priority 1 for {parts[0]}")
+            priority = 1
+        urls.append((parts[0], priority))
+    return urls
+
+def new_job(url, priority=1):
+    """Create a batch job record with its initial status"""
+    return {
+        'url': url,
+        'priority': priority,
+        'status': 'queued',  # queued -> fetching -> fetched -> merging -> done / skipped / failed / cancelled
+        'title': None,
+        'filename': None,
+        'error': None,
+        'metrics': {},
+        'cancel': threading.Event(),
+    }
+
+def fail_job(job, error):
+    job['status'] = 'failed'
+    job['error'] = error
+
+output_claims = set()  # absolute paths of the MP4s running jobs are writing
+output_claims_lock = threading.Lock()
+
+def claim_output_name(output_dir, title, video_id):
+    """Filename for a job's MP4 that no other running job is writing to: the title, or
+    'Title [ID]' if another job already has that name. Returns None if both are taken."""
+    base = format_filename(title)
+    names = [f"{base}.mp4"] + ([f"{base} [{video_id}].mp4"] if video_id else [])
+    with output_claims_lock:
+        for name in names:
+            path = os.path.abspath(os.path.join(output_dir, name))
+            if path not in output_claims:
+                output_claims.add(path)
+                return name
+    return None
+
+def release_output_name(output_dir, filename):
+    with output_claims_lock:
+        output_claims.discard(os.path.abspath(os.path.join(output_dir, filename)))
+
+def fetch_job(job, output_dir, preferred_quality):
+    """Fetch stage of a batch job: info -> format -> stream download. Returns a merge task or None."""
+    url = job['url']
+    if not is_valid_youtube_url(url):
+        fail_job(job, 'Invalid YouTube URL')
+        return None
+    if load_config().get('archive_enabled', True) and is_archived(extract_video_id(url), preferred_quality):
+        job['status'] = 'skipped'
+        job['error'] = 'Already in download archive'
+        return None
+    started = time.monotonic()
+    info = get_video_info(url)
+    job['metrics'].update({'extract_seconds': time.monotonic() - started,
+                           'cache': getattr(cache_events, 'event', None)})
+    if not info:
+        fail_job(job, 'Could not fetch video info')
+        return None
+    record = compact_video_record(info, select_video_format(info, preferred_quality, job['priority']))
+    del info  # don't hold the full info dict for the length of the download
+    job['title'] = record.title
+    if not record.video_format:
+        fail_job(job, 'No suitable video format within budget')
+        return None
+    task = None
+    try:
+        task = fetch_selected(job, record, output_dir)
+    finally:
+        # The batch budget was charged at selection; give it back unless the fetch succeeded
+        if not task:
+            release_budget(record.estimated_bytes)
+    if not task:
+        return None
+    task['quality'] = preferred_quality
+    job['metrics'].update(task['metrics'])
+    return task
+
+def fetch_selected(job, record, output_dir):
+    """Claim the output name, reserve disk space and fetch the selected format.
+    Returns the merge task, or None with the job's status set."""
+    job['filename'] = claim_output_name(output_dir, record.title, record.video_id)
+    if not job['filename']:
+        fail_job(job, 'Already being downloaded by another job')
+        return None
+    job['claimed'] = True
+    job['reservation'] = reserve_space(record.estimated_bytes, output_dir, job['cancel'])
+    if job['reservation'] is None:
+        if job['cancel'].is_set():
+            job['status'] = 'cancelled'
+        else:
+            fail_job(job, 'Not enough disk space')
+        return None
+    task = fetch_streams(job['url'], record.video_format['format_id'], output_dir, job['filename'],
+                         record.download_info, quiet=True, priority=job['priority'],
+                         cancel_event=job['cancel'])
+    if job['cancel'].is_set():
+        job['status'] = 'cancelled'
+        return None
+    if not task:
+        fail_job(job, 'Download failed')
+        return None
+    return task
+
+def merge_job(job, task):
+    """Merge stage of a batch job"""
+    merged = merge_streams(task, quiet=True)
+    job['metrics'].update(task['metrics'])
+    if merged:
+        job['status'] = 'done'
+        record_archive(task['video_id'], task['quality'], task['format_id'])
+    else:
+        fail_job(job, 'Merge failed')
+
+def run_batch(urls, max_workers, output_dir, merge_workers=None, keep_jobs=True, on_finish=None,
+              on_fetched=None):
+    """Download all URLs and return the job list.
+
+    Jobs run through two separately sized thread pools: fetch workers resolve and download
+    the streams, then hand off through a bounded queue to merge workers running FFmpeg, so
+    the next video downloads while the previous one is being muxed. urls may be any
+    iterable, including the lazy generator from expand_urls; it is consumed only as fast
+    as the workers pick jobs up. Items may also be job dicts from new_job; a long-running
+    caller that tracks them itself passes keep_jobs=False. on_finish(job) is called from
+    the worker thread whenever a job reaches a final status, and on_fetched(job) when a
+    job's fetch is done and it has been handed to the merge queue.
+    """
+    config = load_config()
+    max_workers = max(1, min(max_workers, MAX_BATCH_WORKERS))
+    merge_workers = max(1, min(merge_workers or config.get('merge_workers', 2), MAX_BATCH_WORKERS))
+    preferred_quality = config.get('quality', '1080p')
+    jobs = []
+    # Bounded so playlist pages are only fetched as workers become free
+    job_queue = queue.Queue(maxsize=max_workers * 2)
+    # Bounded so fetchers pause instead of piling up unmerged streams on disk
+    merge_queue = queue.Queue(maxsize=merge_workers * 2)
+
+    journal = journal_enabled()
+    # Set on Ctrl+C: interrupted jobs stay unfinished in the journal so they can be resumed
+    interrupted = threading.Event()
+
+    def finish(job):
+        release_space(job.pop('reservation', None))
+        if job.pop('claimed', False):
+            release_output_name(output_dir, job['filename'])
+        emit_job_record(job)
+        if journal and not interrupted.is_set():
+            journal_job(job, output_dir)
+        if on_finish:
+            on_finish(job)
+
+    def producer():
+        seen = set()
+        try:
+            for item in urls:
+                if isinstance(item, dict):
+                    job = item
+                else:
+                    url, priority = item if isinstance(item, tuple) else (item, 1)
+                    # The same video twice would download into the same files
+                    key = extract_video_id(url) or url
+                    if key in seen:
+                        print(f"⏭️  Skipping duplicate URL: {url}")
+                        continue
+                    seen.add(key)
+                    job = new_job(url, priority)
+                if keep_jobs:
+                    jobs.append(job)
+                if journal:
+                    # Look the job up before recording it, which would replace its last state
+                    job['resume'] = lookup_journal(job['url'], output_dir)
+                    record = job['resume']
+                    if not record or (record['status'] != 'done' and not resumable_task(record)):
+                        journal_job(job, output_dir)
+                job_queue.put(job)
+        finally:
+            for _ in range(max_workers):
+                job_queue.put(None)
+
+    def fetch_worker():
+        while True:
+            job = job_queue.get()
+            if job is None:
+                return
+            if job['cancel'].is_set():
+                job['status'] = 'cancelled'
+                finish(job)
+                continue
+            record = job.pop('resume', None)
+            if record and record['status'] == 'done' and record.get('filename') and \
+                    os.path.exists(os.path.join(output_dir, record['filename'])):
+                job.update({'status': 'skipped', 'title': record['title'], 'filename': record['filename'],
+                            'error': 'Already downloaded (job journal)'})
+                emit_job_record(job)
+                if on_finish:
+                    on_finish(job)
+                continue
+            task = resumable_task(record) if record else None
+            if task:
+                # Streams were fully fetched before the restart; only the merge is left
+                job.update({'status': 'fetched', 'title': record['title'], 'filename': record['filename']})
+                merge_queue.put((job, task))
+                if on_fetched:
+                    on_fetched(job)
+                continue
+            job['status'] = 'fetching'
+            if journal:
+                journal_job(job, output_dir)
+            try:
+                task = fetch_job(job, output_dir, preferred_quality)
+            except Exception as e:
+                fail_job(job, str(e))
+                task = None
+            if task:
+                job['status'] = 'fetched'
+                if journal and not interrupted.is_set():
+                    journal_job(job, output_dir, task)
+                merge_queue.put((job, task))
+                if on_fetched:
+                    on_fetched(job)
+            else:
+                finish(job)
+
+    def merge_worker():
+        while True:
+            item = merge_queue.get()
+            if item is None:
+                return
+            job, task = item
+            if job['cancel'].is_set():
+                job['status'] = 'cancelled'
+                finish(job)
+                continue
+            job['status'] = 'merging'
+            try:
+                merge_job(job, task)
+            except Exception as e:
+                fail_job(job, str(e))
+            finish(job)
+
+    print(f"📦 Batch: {max_workers} concurrent download(s), {merge_workers} merge worker(s)")
+    # Time budgets assume the bandwidth limit is split over all fetch workers
+    previous_workers = selection_state['fetch_workers']
+    selection_state['fetch_workers'] = max_workers
+    fetchers = [threading.Thread(target=producer, daemon=True)]
+    fetchers += [threading.Thread(target=fetch_worker, daemon=True) for _ in range(max_workers)]
+    mergers = [threading.Thread(target=merge_worker, daemon=True) for _ in range(merge_workers)]
+    for t in fetchers + mergers:
+        t.start()
+    try:
+        with progress_display():
+            # Join with a timeout so Ctrl+C is still delivered to the main thread
+            while any(t.is_alive() for t in fetchers):
+                for t in fetchers:
+                    t.join(timeout=0.5)
+            for _ in mergers:
+                merge_queue.put(None)
+            while any(t.is_alive() for t in mergers):
+                for t in mergers:
+                    t.join(timeout=0.5)
+    except KeyboardInterrupt:
+        print("\n\n🛑 Batch cancelled.")
+        interrupted.set()
+        for job in jobs:
+            job['cancel'].set()
+            if job['status'] not in ('done', 'skipped', 'failed'):
+                job['status'] = 'cancelled'
+    finally:
+        selection_state['fetch_workers'] = previous_workers
+    return jobs
+
+def print_batch_summary(jobs):
+    """Print a per-job summary and return the process exit code"""
+    print("\n" + "=" * 60)
+    print("📋 Batch summary:")
+    counts = {}
+    for job in jobs:
+        counts[job['status']] = counts.get(job['status'], 0) + 1
+        icon = {'done': '✅', 'failed': '❌', 'skipped': '⏭️ '}.get(job['status'], '⏹️ ')
+        label = job['title'] or job['url']
+        line = f"{icon} {label}"
+        if job['error']:
+            line += f" ({job['error']})"
+        print(line)
+    print("-" * 60)
+    print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+    print(f"🗃️  Metadata cache: {cache_stats['hits']} hit(s), "
+          f"{cache_stats['stale_urls']} stale URL set(s), {cache_stats['misses']} miss(es)")
+    if counts.get('cancelled'):
+        return 130
+    if counts.get('failed'):
+        return 1
+    return 0
+
+def batch_main(source, max_workers, output_dir, start=1, end=None, limit=None):
+    """Non-interactive entry point: download every URL from a file or stdin.
+
+    Playlist and channel URLs are expanded lazily; start/end/limit apply to each of them.
+    """
+    try:
+        urls = read_batch_urls(source)
+    except OSError as e:
+        print(f"❌ Could not read URL list: {str(e)}")
+        return 2
+    if not urls:
+        print("❌ No URLs to download.")
+        return 2
+    # Resolve FFmpeg once up front so workers don't race to install it
+    if not get_ffmpeg_path():
+        print("❌ FFmpeg is required but could not be installed. Please install FFmpeg manually.")
+        return 1
+    recover_journal()
+    jobs = run_batch(expand_urls(urls, start, end, limit), max_workers, output_dir)
+    return print_batch_summary(jobs)
+
+def resume_main(max_workers):
+    """Finish every job the journal shows as unfinished, e.g. after a crash or Ctrl+C"""
+    if not journal_enabled():
+        print("❌ The job journal is disabled (journal_enabled in the config).")
+        return 2
+    records = recover_journal()
+    if not records:
+        print("✅ No unfinished jobs in the journal.")
+        return 0
+    if not get_ffmpeg_path():
+        print("❌ FFmpeg is required but could not be installed. Please install FFmpeg manually.")
+        return 1
+    by_dir = {}
+    for record in records:
+        by_dir.setdefault(record['output_dir'], []).append((record['url'], record['priority']))
+    print(f"♻️  Resuming {len(records)} unfinished job(s)")
+    jobs = []
+    for output_dir, urls in by_dir.items():
+        print(f"📁 {output_dir}")
+        jobs += run_batch(urls, max_workers, output_dir)
+    return print_batch_summary(jobs)
+
+# --- Shared work queue ---
+# Several machines can work through one URL list: the jobs live in an SQLite database on
+# a shared volume and each worker claims one at a time with an expiring lease, renewed by
+# a heartbeat thread. If a worker dies its leases run out and the jobs are claimed again
+# by someone else; a worker that loses a lease stops downloading that job. Claims are
+# made only when a fetch slot is free, so no node hoards work another node could do; a
+# job gives its slot back once it is fetched and only waits for a merge worker.
+SHARED_LEASE_SECONDS = 120
+SHARED_HEARTBEAT_SECONDS = 30
+SHARED_POLL_SECONDS = 5
+SHARED_MAX_ATTEMPTS = 3  # claims per job before an unfinished job is given up on
+
+def open_shared_queue(path):
+    """Open (creating if needed) the shared job database and return the queue state"""
+    import sqlite3
+    import socket
+    import uuid
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+    conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url TEXT UNIQUE NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 1,
+        status TEXT NOT NULL DEFAULT 'queued',
+        worker TEXT,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        title TEXT,
+        error TEXT,
+        updated REAL)""")
+    return {
+        'conn': conn,
+        'lock': threading.Lock(),  # one connection, used by one thread at a time
+        'worker': f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}",
+        'held': {},  # job id -> job dict, for heartbeats and lease checks
+    }
+
+@contextlib.contextmanager
+def shared_transaction(store):
+    """Serialize access to the connection and hold SQLite's write lock for the block"""
+    with store['lock']:
+        conn = store['conn']
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+def seed_shared_queue(store, items):
+    """Add (url, priority) pairs; URLs already in the queue are left alone. Returns the count added."""
+    added = 0
+    for url, priority in items:
+        with shared_transaction(store) as conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO jobs (url, priority, updated) VALUES (?, ?, ?)",
+                                  (url, priority, time.time()))
+            added += cursor.rowcount
+    return added
+
+def claim_shared_job(store):
+    """Lease the next queued (or abandoned) job to this worker. Returns (id, url, priority) or None."""
+    now = time.time()
+    with shared_transaction(store) as conn:
+        conn.execute("UPDATE jobs SET status = 'failed', error = 'Worker lost too many times', updated = ? "
+                     "WHERE status = 'claimed' AND lease_expires < ? AND attempts >= ?",
+                     (now, now, SHARED_MAX_ATTEMPTS))
+        row = conn.execute("SELECT id, url, priority FROM jobs WHERE status = 'queued' "
+                           "OR (status = 'claimed' AND lease_expires < ?) "
+                           "ORDER BY priority DESC, id LIMIT 1", (now,)).fetchone()
+        if row:
+            conn.execute("UPDATE jobs SET status = 'claimed', worker = ?, lease_expires = ?, "
+                         "attempts = attempts + 1, updated = ? WHERE id = ?",
+                         (store['worker'], now + SHARED_LEASE_SECONDS, now, row[0]))
+    return row
+
+def shared_queue_open_count(store):
+    """Number of jobs not finished yet, by any worker"""
+    with store['lock']:
+        return store['conn'].execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'claimed')").fetchone()[0]
+
+def finish_shared_job(store, job):
+    """Record a job's final status, unless its lease has already passed to another worker.
+
+    Cancelled jobs (Ctrl+C or a lost lease) go back to the queue for someone else.
+    """
+    job_id = job['shared_id']
+    if job['status'] == 'cancelled':
+        status, worker = 'queued', None
+    else:
+        status, worker = job['status'], store['worker']
+    with shared_transaction(store) as conn:
+        conn.execute("UPDATE jobs SET status = ?, worker = ?, lease_expires = NULL, title = ?, error = ?, "
+                     "updated = ? WHERE id = ? AND worker = ? AND status = 'claimed'",
+                     (status, worker, job['title'], job['error'], time.time(), job_id, store['worker']))
+    store['held'].pop(job_id, None)
+
+def renew_shared_leases(store):
+    """Heartbeat: extend this worker's leases and cancel any job whose lease was lost"""
+    now = time.time()
+    for job_id, job in list(store['held'].items()):
+        with shared_transaction(store) as conn:
+            renewed = conn.execute("UPDATE jobs SET lease_expires = ?, updated = ? "
+                                   "WHERE id = ? AND worker = ? AND status = 'claimed'",
+                                   (now + SHARED_LEASE_SECONDS, now, job_id, store['worker'])).rowcount
+        if not renewed:
+            print(f"⚠️  Lost the lease on {job['url']}; another worker has it now")
+            store['held'].pop(job_id, None)
+            job['cancel'].set()
+
+def run_shared_heartbeat(store, stop):
+    while not stop.wait(SHARED_HEARTBEAT_SECONDS):
+        try:
+            renew_shared_leases(store)
+        except Exception as e:
+            print(f"⚠️  Heartbeat failed: {str(e)}")
+
+def iter_shared_jobs(store, slots):
+    """Yield claimed jobs, one per free fetch slot, until every job in the queue is finished"""
+    while True:
+        slots.acquire()
+        row = claim_shared_job(store)
+        if row:
+            job = new_job(row[1], row[2])
+            job['shared_id'] = row[0]
+            job['slot'] = True  # given back by release_slot once the job leaves the fetch stage
+            store['held'][row[0]] = job
+            yield job
+            continue
+        slots.release()
+        if not shared_queue_open_count(store):
+            return
+        # Other workers still hold jobs; theirs come back to the queue if they die
+        time.sleep(SHARED_POLL_SECONDS)
+
+def shared_main(db_path, source, max_workers, output_dir, start=1, end=None, limit=None):
+    """Work through a job database shared with other machines, seeding it from source if given"""
+    import sqlite3
+    try:
+        store = open_shared_queue(db_path)
+    except sqlite3.Error as e:
+        print(f"❌ Could not open shared queue {db_path}: {str(e)}")
+        return 2
+    if source:
+        try:
+            urls = read_batch_urls(source)
+        except OSError as e:
+            print(f"❌ Could not read URL list: {str(e)}")
+            return 2
+        added = seed_shared_queue(store, expand_urls(urls, start, end, limit))
+        print(f"🗂️  Added {added} new job(s) to the shared queue")
+    if not get_ffmpeg_path():
+        print("❌ FFmpeg is required but could not be installed. Please install FFmpeg manually.")
+        return 1
+    recover_journal()
+    max_workers = max(1, min(max_workers, MAX_BATCH_WORKERS))
+    slots = threading.BoundedSemaphore(max_workers)
+    stop = threading.Event()
+    threading.Thread(target=run_shared_heartbeat, args=(store, stop), daemon=True).start()
+
+    def release_slot(job):
+        # A fetched job only waits for a merge worker, so its slot can go to the next claim;
+        # the lease is kept (and renewed) until the job is finished
+        if job.pop('slot', False):
+            slots.release()
+
+    def on_finish(job):
+        finish_shared_job(store, job)
+        release_slot(job)
+
+    print(f"🤝 Worker {store['worker']} joining shared queue {db_path}")
+    try:
+        jobs = run_batch(iter_shared_jobs(store, slots), max_workers, output_dir, on_finish=on_finish,
+                         on_fetched=release_slot)
+    finally:
+        stop.set()
+        # Hand back whatever was still in flight (Ctrl+C) so other workers can take it now
+        for job in list(store['held'].values()):
+            job['status'] = 'cancelled'
+            finish_shared_job(store, job)
+    return print_batch_summary(jobs)
+
+# --- Service mode ---
+# A long-running process that accepts jobs over a local HTTP API and feeds them to one
+# run_batch pipeline, so the warm extractor pool, metadata cache, archive and FFmpeg probe
+# are shared by every request instead of being rebuilt per invocation.
+DAEMON_DEFAULT_PORT = 8787
+DAEMON_MAX_FINISHED_JOBS = 1000
+FINISHED_STATUSES = ('done', 'skipped', 'failed', 'cancelled')
+
+daemon_state = {
+    'jobs': {},  # id -> job dict, in submission order
+    'next_id': 1,
+    'queue': None,
+}
+daemon_lock = threading.Lock()
+
+def job_status(job):
+    """JSON-friendly view of a job for the service API"""
+    return {
+        'id': job['id'],
+        'url': job['url'],
+        'priority': job['priority'],
+        'status': job['status'],
+        'title': job['title'],
+        'filename': job['filename'],
+        'error': job['error'],
+        'source': job.get('source'),
+    }
+
+def prune_finished_jobs():
+    """Drop the oldest finished jobs so a long-running service doesn't grow without bound"""
+    jobs = daemon_state['jobs']
+    finished = [job_id for job_id, job in jobs.items() if job['status'] in FINISHED_STATUSES]
+    for job_id in finished[:max(0, len(finished) - DAEMON_MAX_FINISHED_JOBS)]:
+        del jobs[job_id]
+
+def register_job(url, priority, source=None):
+    """Create a job, give it an id and queue it for the service pipeline"""
+    job = new_job(url, priority)
+    job['source'] = source
+    with daemon_lock:
+        job['id'] = daemon_state['next_id']
+        daemon_state['next_id'] += 1
+        daemon_state['jobs'][job['id']] = job
+        prune_finished_jobs()
+    daemon_state['queue'].put(job)
+    return job
+
+def submit_urls(urls, priority=1):
+    """Queue video URLs directly and expand playlist/channel URLs in the background.
+
+    Returns (jobs, playlists): the video jobs created now and the playlist URLs whose
+    entries will show up as jobs with that URL as their source.
+    """
+    jobs, playlists = [], []
+    for url in urls:
+        if is_playlist_url(url):
+            playlists.append(url)
+        else:
+            jobs.append(register_job(url, priority))
+
+    def expand():
+        for url in playlists:
+            try:
+                for entry_url in iter_playlist_entries(url):
+                    register_job(entry_url, priority, source=url)
+            except Exception as e:
+                print(f"❌ Could not expand {url}: {str(e)}")
+
+    if playlists:
+        threading.Thread(target=expand, daemon=True).start()
+    return jobs, playlists
+
+def cancel_job(job_id):
+    """Cancel a queued or running job; returns the job, or None if the id is unknown"""
+    with daemon_lock:
+        job = daemon_state['jobs'].get(job_id)
+    if job is None:
+        return None
+    job['cancel'].set()
+    if job['status'] == 'queued':
+        job['status'] = 'cancelled'
+    return job
+
+def start_api_server(port, host='127.0.0.1'):
+    """Serve the job API from a daemon thread:
+
+    POST /jobs {"url": ...} or {"urls": [...], "priority": N}, GET /jobs, GET /jobs/<id>,
+    DELETE /jobs/<id> to cancel, and GET /metrics.
+    """
+    import http.server
+
+    class ApiHandler(http.server.BaseHTTPRequestHandler):
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def route(self):
+            """Split the path into ('jobs', job_id or None), or None if it isn't a job route"""
+            parts = self.path.split('?')[0].strip('/').split('/')
+            if parts[0] != 'jobs' or len(parts) > 2:
+                return None
+            if len(parts) == 1:
+                return 'jobs', None
+            return ('jobs', int(parts[1])) if parts[1].isdigit() else None
+
+        def do_GET(self):
+            if self.path.split('?')[0] == '/metrics':
+                body = render_metrics().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            route = self.route()
+            if route is None:
+                self.send_error(404)
+                return
+            with daemon_lock:
+                if route[1] is None:
+                    self.send_json(200, {'jobs': [job_status(job) for job in daemon_state['jobs'].values()]})
+                    return
+                job = daemon_state['jobs'].get(route[1])
+            if job is None:
+                self.send_json(404, {'error': 'unknown job'})
+            else:
+                self.send_json(200, job_status(job))
+
+        def do_POST(self):
+            if self.route() != ('jobs', None):
+                self.send_error(404)
+                return
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                request = json.loads(self.rfile.read(length) or b'{}')
+                urls = request.get('urls') or [request.get('url')]
+                if not isinstance(urls, list):
+                    raise ValueError("urls must be a list")
+                priority = parse_priority(request.get('priority'))
+            except (ValueError, TypeError, AttributeError) as e:
+                self.send_json(400, {'error': f'invalid request: {str(e)}'})
+                return
+            urls = [url.strip() for url in urls if isinstance(url, str) and url.strip()]
+            invalid = [url for url in urls if not is_valid_youtube_url(url)]
+            if not urls or invalid:
+                self.send_json(400, {'error': 'no valid YouTube URLs', 'invalid': invalid})
+                return
+            jobs, playlists = submit_urls(urls, priority)
+            self.send_json(202, {'jobs': [job_status(job) for job in jobs], 'expanding': playlists})
+
+        def do_DELETE(self):
+            route = self.route()
+            if route is None or route[1] is None:
+                self.send_error(404)
+                return
+            job = cancel_job(route[1])
+            if job is None:
+                self.send_json(404, {'error': 'unknown job'})
+            else:
+                self.send_json(200, job_status(job))
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), ApiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def serve_main(port, max_workers, output_dir):
+    """Service entry point: run the download pipeline until Ctrl+C"""
+    if not get_ffmpeg_path():
+        print("❌ FFmpeg is required but could not be installed. Please install FFmpeg manually.")
+        return 1
+    # Warm the FFmpeg probe and yt-dlp import before the first job arrives
+    warm_up()
+    daemon_state['queue'] = queue.Queue()
+    output_dir = os.path.abspath(output_dir)
+    pending = [record for record in recover_journal() if record['output_dir'] == output_dir]
+    try:
+        server = start_api_server(port)
+    except OSError as e:
+        print(f"❌ Could not listen on port {port}: {str(e)}")
+        return 1
+    print(f"🛰️  Listening on http://127.0.0.1:{port}/jobs (Ctrl+C to stop)")
+    print(f"📁 Saving to: {output_dir}")
+    if pending:
+        print(f"♻️  Resuming {len(pending)} unfinished job(s) from the journal")
+        for record in pending:
+            register_job(record['url'], record['priority'])
+    try:
+        run_batch(iter(daemon_state['queue'].get, None), max_workers, output_dir, keep_jobs=False)
+    finally:
+        server.shutdown()
+        with daemon_lock:
+            jobs = list(daemon_state['jobs'].values())
+        for job in jobs:
+            job['cancel'].set()
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="YouTube Video Downloader")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="download every URL listed in FILE ('-' reads from stdin)")
+    parser.add_argument('--serve', type=int, nargs='?', const=DAEMON_DEFAULT_PORT, default=None,
+                        metavar='PORT', help="run as a service with a job API on "
+                        f"http://127.0.0.1:PORT (default port {DAEMON_DEFAULT_PORT})")
+    parser.add_argument('--shared-queue', metavar='DB',
+                        help="share work with other machines through the SQLite job database DB "
+                        "(on a shared volume); with --batch the URLs are added to it first")
+    parser.add_argument('--resume', action='store_true',
+                        help="finish the jobs left unfinished by an interrupted batch and exit")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help=f"number of concurrent downloads in batch or service mode (max {MAX_BATCH_WORKERS})")
+    parser.add_argument('-o', '--output', default=None,
+                        help="output directory (default: current directory)")
+    parser.add_argument('--staging-dir', default=None, metavar='DIR',
+                        help="download and merge in DIR (e.g. fast local scratch), then move finished "
+                        "files to the output directory")
+    parser.add_argument('--limit-rate', type=float, default=None, metavar='MBPS',
+                        help="total download rate limit in megabits per second, shared by all jobs")
+    parser.add_argument('--autotune', action='store_true',
+                        help="tune fragment concurrency for DASH/HLS downloads from measured throughput")
+    parser.add_argument('--max-size', type=float, default=None, metavar='MB',
+                        help="pick the best format whose video plus audio fits in MB per video")
+    parser.add_argument('--batch-budget', type=float, default=None, metavar='MB',
+                        help="total MB all videos of this run may download; later videos get smaller formats")
+    parser.add_argument('--time-budget', type=float, default=None, metavar='SECONDS',
+                        help="pick formats that download within SECONDS at this job's share of the rate "
+                        "limit (or the measured throughput)")
+    parser.add_argument('--prefer-codec', choices=sorted(CODEC_FAMILIES), default=None,
+                        help="prefer this video codec between formats of the same resolution")
+    parser.add_argument('--metrics-jsonl', metavar='FILE',
+                        help="append one JSON record per finished job to FILE")
+    parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                        help="serve aggregate metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--rebuild-archive', metavar='DIR',
+                        help="rebuild the download archive from the MP4 files in DIR and exit")
+    parser.add_argument('--playlist-start', type=int, default=1, metavar='N',
+                        help="first playlist/channel entry to download (1-based)")
+    parser.add_argument('--playlist-end', type=int, default=None, metavar='N',
+                        help="last playlist/channel entry to download (inclusive)")
+    parser.add_argument('--limit', type=int, default=None, metavar='N',
+                        help="download at most N entries from each playlist/channel")
+    return parser.parse_args(argv)
+
+def warm_up():
+    """Probe FFmpeg and import yt-dlp while the user is typing the first URL"""
+    try:
+        ffmpeg_path = find_ffmpeg()
+        if ffmpeg_path:
+            probe_ffmpeg(ffmpeg_path)
+        import yt_dlp  # noqa: F401
+    except Exception:
+        # Anything that fails here is reported again when it is actually needed
+        pass
+
+def start_background_checks():
+    """Run warm_up in a daemon thread and return it"""
+    thread = threading.Thread(target=warm_up, daemon=True)
+    thread.start()
+    return thread
+
 def main():
     clear_screen()
     print_banner()
-    print("🔍 Checking for FFmpeg...")
-    ffmpeg_path = get_ffmpeg_path()
-    if ffmpeg_path:
-        print("✅ FFmpeg is ready!")
-    else:
-        print("❌ FFmpeg installation failed. The application may not work properly.")
+    # FFmpeg is resolved in the background and only downloaded when the first video needs it
+    start_background_checks()
     print("\n" + "="*60)
     while True:
         try:
@@ -465,21 +3020,45 @@ def main():
             if not is_valid_youtube_url(url):
                 print("❌ Invalid YouTube URL. Please enter a valid YouTube video URL.")
                 continue
+            if is_playlist_url(url):
+                if not get_ffmpeg_path():
+                    print("❌ FFmpeg is required but could not be installed. Please install FFmpeg manually.")
+                    continue
+                config = load_config()
+                print("\n⏳ Expanding playlist...")
+                jobs = run_batch(expand_urls([url]), config.get('batch_workers', 3), os.getcwd())
+                print_batch_summary(jobs)
+                input("Press Enter to continue...")
+                clear_screen()
+                print_banner()
+                continue
+            config = load_config()
+            preferred_quality = config.get('quality', '1080p')
+            if config.get('archive_enabled', True) and is_archived(extract_video_id(url), preferred_quality):
+                print("⏭️  This video is already in the download archive.")
+                continue
             print("\n⏳ Fetching video information...")
             info = get_video_info(url)
             if not info:
                 continue
-            display_video_info(info)
-            config = load_config()
-            preferred_quality = config.get('quality', '1080p')
-            selected_format = get_best_video_format(info, preferred_quality)
-            if not selected_format:
+            record = compact_video_record(info, select_video_format(info, preferred_quality))
+            info = None  # only the compact record is kept from here on
+            display_video_info(record)
+            if not record.video_format:
                 continue
-            display_selected_format(selected_format)
-            output_dir = os.getcwd()
-            base_filename = format_filename(info.get('title', 'video'))
-            filename = f"{base_filename}.mp4"
-            download_video_with_audio(url, selected_format['format_id'], output_dir, filename)
+            downloaded = False
+            try:
+                display_selected_format(record.video_format, record.estimated_bytes)
+                output_dir = os.getcwd()
+                base_filename = format_filename(record.title)
+                filename = f"{base_filename}.mp4"
+                downloaded = download_video_with_audio(url, record.video_format['format_id'], output_dir,
+                                                       filename, record.download_info, preferred_quality,
+                                                       record.estimated_bytes)
+            finally:
+                # The batch budget was charged at selection; give it back unless it was used
+                if not downloaded:
+                    release_budget(record.estimated_bytes)
             clear_screen()
             print_banner()
         except KeyboardInterrupt:
@@ -490,4 +3069,37 @@ def main():
             input("Press Enter to continue...")
 
 if __name__ == "__main__":
+    args = parse_args()
+    set_bandwidth_limit(args.limit_rate if args.limit_rate is not None
+                        else load_config().get('bandwidth_limit_mbps', 0))
+    autotune_state['enabled'] = args.autotune
+    config = load_config()
+    selection_state.update({
+        'max_bytes': int((args.max_size or config.get('max_video_mb') or 0) * 1024 * 1024) or None,
+        'batch_bytes': int((args.batch_budget or config.get('batch_budget_mb') or 0) * 1024 * 1024) or None,
+        'max_seconds': args.time_budget or config.get('time_budget_seconds') or None,
+        'codec': args.prefer_codec or config.get('preferred_codec'),
+    })
+    disk_state['staging_dir'] = args.staging_dir or config.get('staging_dir')
+    metrics_state['jsonl_path'] = args.metrics_jsonl
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    if args.rebuild_archive:
+        count = rebuild_archive(args.rebuild_archive)
+        print(f"✅ Download archive rebuilt with {count} video(s): {get_archive_path()}")
+        sys.exit(0)
+    if args.shared_queue:
+        max_workers = args.jobs or load_config().get('batch_workers', 3)
+        sys.exit(shared_main(args.shared_queue, args.batch, max_workers, args.output or os.getcwd(),
+                             args.playlist_start, args.playlist_end, args.limit))
+    if args.resume:
+        sys.exit(resume_main(args.jobs or load_config().get('batch_workers', 3)))
+    if args.serve:
+        max_workers = args.jobs or load_config().get('batch_workers', 3)
+        sys.exit(serve_main(args.serve, max_workers, args.output or os.getcwd()))
+    if args.batch:
+        config = load_config()
+        max_workers = args.jobs or config.get('batch_workers', 3)
+        sys.exit(batch_main(args.batch, max_workers, args.output or os.getcwd(),
+                            args.playlist_start, args.playlist_end, args.limit))
     main()
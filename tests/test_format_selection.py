@@ -0,0 +1,170 @@
+import io
+import os
+import sys
+import json
+import tempfile
+import unittest
+import contextlib
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def load_ladder(name='youtube_format_ladder.json'):
+    """A format list recorded from a YouTube video (212 s, 144p to 2160p60)"""
+    with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def select(info, quality='1080p', **budget):
+    with contextlib.redirect_stdout(io.StringIO()):
+        fmt = main.get_best_video_format(info, quality, budget)
+    return fmt['format_id'] if fmt else None
+
+class FormatSelectionTest(unittest.TestCase):
+    def setUp(self):
+        self.info = load_ladder()
+
+    def test_smallest_codec_wins_at_same_height_and_fps(self):
+        # 1080p60: avc1 299 (~62 MB), vp9 303 (48 MB), 616 without any size
+        self.assertEqual(select(self.info), '303')
+        # 720p60: avc1 298, vp9 302 (smaller)
+        self.assertEqual(select(self.info, '720p'), '302')
+        # 720p30: avc1 136, vp9 247, av01 398 (smallest)
+        self.info['formats'] = [fmt for fmt in self.info['formats'] if fmt.get('fps') != 60]
+        self.assertEqual(select(self.info, '720p'), '398')
+
+    def test_max_bytes_includes_paired_audio(self):
+        audio = main.get_best_audio_format(self.info)
+        self.assertEqual(audio['format_id'], '140')
+        # av01 399 (1080p30) is 26528972 bytes, plus 3441068 of m4a audio
+        self.assertEqual(select(self.info, max_bytes=26528972 + 3441068), '399')
+        # One byte less rules out every 1080p and 720p60 format
+        self.assertEqual(select(self.info, max_bytes=26528972 + 3441068 - 1), '398')
+
+    def test_max_bytes_skips_formats_of_unknown_size(self):
+        self.info['formats'] = [fmt for fmt in self.info['formats']
+                                if fmt['vcodec'] == 'none' or fmt['format_id'] in ('616', '398')]
+        # Without a budget the unsized format still wins on frame rate
+        self.assertEqual(select(self.info), '616')
+        self.assertEqual(select(self.info, max_bytes=10 ** 12), '398')
+
+    def test_exhausted_budget_selects_nothing(self):
+        self.assertIsNone(select(self.info, max_bytes=1))
+
+    def test_exhausted_batch_budget(self):
+        state = dict(main.selection_state)
+        self.addCleanup(main.selection_state.update, state)
+        main.selection_state.update({'max_bytes': None, 'max_seconds': None, 'codec': None,
+                                     'batch_bytes': 100 * 1024 * 1024, 'batch_spent': 100 * 1024 * 1024})
+        self.assertEqual(main.current_budget()['max_bytes'], 1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertIsNone(main.select_video_format(self.info))
+        main.release_budget(60 * 1024 * 1024)
+        with contextlib.redirect_stdout(io.StringIO()):
+            fmt = main.select_video_format(self.info)
+        self.assertEqual(fmt['format_id'], '303')
+        self.assertEqual(main.selection_state['batch_spent'], 40 * 1024 * 1024 + 50331648 + 3441068)
+
+    def test_preferred_codec_breaks_ties_only(self):
+        self.assertEqual(select(self.info, codec='h264'), '299')
+        self.assertEqual(select(self.info, '720p', codec='av1'), '302')  # no av01 at 720p60
+        # A preferred codec never beats a higher resolution or frame rate
+        self.info['formats'] = [fmt for fmt in self.info['formats'] if fmt.get('fps') != 60]
+        self.assertEqual(select(self.info, codec='h264'), '137')
+        self.assertEqual(select(self.info, codec='av1'), '399')
+
+    def test_codec_family(self):
+        self.assertEqual(main.codec_family('avc1.64002a'), 'h264')
+        self.assertEqual(main.codec_family('vp09.00.40.08'), 'vp9')
+        self.assertEqual(main.codec_family('vp9'), 'vp9')
+        self.assertEqual(main.codec_family('av01.0.08M.08'), 'av1')
+        self.assertIsNone(main.codec_family('none'))
+
+    def test_falls_back_to_highest_when_nothing_is_at_or_below_target(self):
+        self.info['formats'] = [fmt for fmt in self.info['formats']
+                                if fmt['vcodec'] == 'none' or fmt['height'] >= 1440]
+        self.assertEqual(select(self.info, '720p'), '315')
+        self.assertIsNone(select(self.info, '720p', max_bytes=1))
+
+    def test_no_video_formats(self):
+        self.assertIsNone(select({'formats': []}))
+        self.assertIsNone(select({}))
+
+
+class SizeEstimateTest(unittest.TestCase):
+    def test_filesize_then_approx_then_bitrate(self):
+        fmt = {'filesize': 1000, 'filesize_approx': 2000, 'tbr': 8}
+        self.assertEqual(main.estimate_format_size(fmt, 10), 1000)
+        del fmt['filesize']
+        self.assertEqual(main.estimate_format_size(fmt, 10), 2000)
+        del fmt['filesize_approx']
+        self.assertEqual(main.estimate_format_size(fmt, 10), 10000)  # 8 kbit/s for 10 s
+        self.assertIsNone(main.estimate_format_size(fmt))
+
+    def test_vbr_plus_abr_without_tbr(self):
+        self.assertEqual(main.estimate_format_size({'vbr': 6, 'abr': 2}, 10), 10000)
+        self.assertIsNone(main.estimate_format_size({}, 10))
+        self.assertIsNone(main.estimate_format_size(None, 10))
+
+    def test_total_needs_video_size(self):
+        video = load_ladder()['formats'][-1]  # 2160p60, tbr only
+        audio = {'filesize': 500}
+        self.assertEqual(main.estimate_total_size(video, audio, 212), int(14321.0 * 1000 / 8 * 212) + 500)
+        self.assertEqual(main.estimate_total_size(video, None, 212), int(14321.0 * 1000 / 8 * 212))
+        self.assertIsNone(main.estimate_total_size({}, audio, 212))
+
+
+class TimeBudgetTest(unittest.TestCase):
+    def setUp(self):
+        selection = dict(main.selection_state)
+        self.addCleanup(main.selection_state.update, selection)
+        self.addCleanup(main.bandwidth_state.update, {'rate': main.bandwidth_state['rate'],
+                                                      'active': dict(main.bandwidth_state['active'])})
+        main.selection_state.update({'max_bytes': None, 'max_seconds': 100, 'codec': None,
+                                     'batch_bytes': None, 'batch_spent': 0, 'fetch_workers': 1})
+        main.bandwidth_state.update({'rate': 1000, 'active': {}})
+
+    def test_single_fetch_gets_the_whole_limit(self):
+        self.assertEqual(main.current_budget()['max_bytes'], 100 * 1000)
+
+    def test_limit_is_shared_with_running_and_idle_fetches(self):
+        main.bandwidth_state['active'] = {'a': 1, 'b': 1}
+        main.selection_state['fetch_workers'] = 4
+        # Two running, this one, and one idle worker: a quarter each
+        self.assertEqual(main.current_budget()['max_bytes'], 25 * 1000)
+        # Priority 2 against three priority-1 fetches gets two fifths
+        self.assertEqual(main.current_budget(priority=2)['max_bytes'], 40 * 1000)
+
+
+class BudgetReleaseTest(unittest.TestCase):
+    def setUp(self):
+        selection = dict(main.selection_state)
+        self.addCleanup(main.selection_state.update, selection)
+        main.selection_state.update({'max_bytes': None, 'max_seconds': None, 'codec': None,
+                                     'batch_bytes': 10 ** 9, 'batch_spent': 0})
+
+    def test_error_after_selection_releases_budget(self):
+        job = main.new_job('https://www.youtube.com/watch?v=aqz-KE-bpKQ')
+        output_dir = tempfile.gettempdir()
+        charged = []
+
+        def reserve_space(nbytes, *args):
+            charged.append(main.selection_state['batch_spent'])
+            raise OSError('Read-only file system')
+
+        with mock.patch.object(main, 'load_config', return_value={'archive_enabled': False}), \
+                mock.patch.object(main, 'get_video_info', return_value=load_ladder()), \
+                mock.patch.object(main, 'reserve_space', side_effect=reserve_space), \
+                contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(OSError):
+                main.fetch_job(job, output_dir, '1080p')
+        main.release_output_name(output_dir, job['filename'])
+        self.assertEqual(charged, [50331648 + 3441068])  # 303 and 140
+        self.assertEqual(main.selection_state['batch_spent'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()